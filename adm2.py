@@ -6,10 +6,22 @@ from scipy.stats import wilcoxon # test for difference
 
 
 # system
+import collections
 import copy
+import hashlib
+import heapq
 import pickle
+import sys
+import time
+import tracemalloc
+import zlib
 
 import threeobj as th
+import resstore as rs
+import report as rp
+import seqtest as sq
+import admtrace as at
+import sweep as sw
 
 # Output
 import xlsxwriter
@@ -68,6 +80,44 @@ def box2rindex(mn,mx):
 def rindex2box(v):
     return np.array(v).reshape(2,-1).tolist()
 
+## Returns the list of components of v rounded to the nearest float32 values
+def round32(v):
+    return np.asarray(v,dtype=np.float32).astype(float).tolist()
+
+### Compact value objects (compact mode of ADM): coordinates are packed in
+#  float32 arrays and unpacked to lists on access, so that the objects can be
+#  used in place of the lists they replace
+## Box [[min vect., max vect.], id] (as ADM.bestbox)
+class boxrec:
+    __slots__=("v","id")
+    def __init__(self,b,rid):
+        self.v=np.array(b,dtype=np.float32).reshape(-1)
+        self.id=rid
+
+    def __len__(self):
+        return 2
+
+    def __getitem__(self,i):
+        return [self.v.reshape(2,-1).astype(float).tolist(),self.id][i]
+
+    def __repr__(self):
+        return "boxrec("+repr(self[0])+","+repr(self.id)+")"
+
+## Preference information [aspiration vect., reservation vect.]
+class prefrec:
+    __slots__=("v",)
+    def __init__(self,pref):
+        self.v=np.array(pref,dtype=np.float32)
+
+    def __len__(self):
+        return len(self.v)
+
+    def __getitem__(self,i):
+        return self.v.astype(float).tolist()[i]
+
+    def __repr__(self):
+        return "prefrec("+repr(self.v.tolist())+")"
+
 ## Recursive function for generating all open boxes partitioning a given box,
 #  resulted from subtracting the dual domination cone (represented by its vertex)
 # Given: 
@@ -114,6 +164,16 @@ def divbox_rec(vrange,nlo,nhi,k,ii):
                    divbox_rec(vhi,nlo,nhi+1,k,i+1)
                            
 
+## Returns the approximate nr. of bytes of an rtree index with nbox boxes
+#  in ndim dimensions and node capacity: each entry keeps its region
+#  (2*ndim doubles) with an id and object overheads, nodes are assumed
+#  70% full (the libspatialindex fill factor) with arrays for capacity+1 entries
+def index_nbytes(nbox,ndim,capacity):
+    entry=16*ndim+64
+    nleaves=int(np.ceil(nbox/(0.7*capacity)))
+    nnodes=nleaves+int(np.ceil(nleaves/(0.7*capacity-1)))
+    return nbox*entry+nnodes*(24*(capacity+1)+entry)
+
 ### Potential region structure for minimization problems based on 
 #                                                       rtree package class.
 #   Box ID (int) attribute assigned to the boxes in the original rtree class
@@ -122,61 +182,229 @@ def divbox_rec(vrange,nlo,nhi,k,ii):
 #    .ndim = nr. of space dimensions 
 #    .nbox = number of boxes in the structure
 #    .ncre = number of acts of boxes creation
+#    .ndel = number of acts of boxes removal
+#    .splits = {nr. of parts: nr. of boxes cut into this nr. of parts}
+#              (histogram of split fan-out, 0 parts = box removed by a cut)
 #    ._hypervol = sum of hypervolume of existing boxes
+#    .storage = None for in-memory index, otherwise base name of the files 
+#               <storage>.idx, <storage>.dat of the index and <storage>.pkl
+#               of the attributes above and .extra
+#    .extra = data of the owner saved and reopened with the attributes
+#             (e.g. the Pareto archive of ADM), None by default
+#    .lazy = None for splitting boxes in addpoint immediately, otherwise
+#            the max. nr. of cut vertices a box may keep pending before it is
+#            divided into parts (lazy mode); boxes are also divided when they
+#            are candidates in bestbox (see .materialize) or boxes() is called
+#    ._pending = {box id: [rlist vector, [pending cut vertices], 
+#                          hypervolume of parts or None]}
+#    .compact = True if coordinates of boxes are float32 values: cut vertices
+#               are rounded to float32, and a vertex on an edge of a box
+#               does not divide it, so that no boxes of zero float32 width
+#               appear; pending vectors are kept as float32 arrays
+#    ._bids, ._bmins, ._bmaxs = arrays of ids, min. and max. vectors (rows)
+#               of boxes in the first nbox rows (box slab), so that queries
+#               return boxes as arrays without rtree objects (see boxes_array);
+#               None for disk storage, where boxes are read from the index
+#               so that the memory stays bounded
+#    ._slot = {box id: row of the box in the slab} of existing boxes
+#       in lazy mode, nbox and _hypervol count a box with pending cuts 
+#       as a whole; the exact hypervolume is returned by .hypervol()
+## Disk storage options (used if storage is not None):
+#    pagesize = size of index pages in bytes
+#    buffering = nr. of pages kept in the in-memory buffer
+#    reopen = True for reopening the potential region saved in the files of
+#             storage (FileNotFoundError if there are none), otherwise
+#             existing files are overwritten by a new potential region
+#  Boxes are read from the disk index leaf by leaf (see iterboxes), but
+#  boxes() and boxes_array() return all of them in memory.
 class potreg(rindex.Index):
     
-    def __init__(self,ideal,nadir):
+    def __init__(self,ideal,nadir,capacity=16,
+                 storage=None,pagesize=4096,buffering=64,lazy=None,
+                 compact=False,reopen=False):
         # setting the space dimension and passing to rtree in a Property object
         ndim=len(ideal)
         p = rindex.Property()
         p.dimension = ndim
-        # initializing the object
-        rindex.Index.__init__(self,properties=p)
+        # small nodes make both splitting and bounds of leaves (see 
+        # ADM._bestbox_bb) more local than the rtree default of 100
+        p.leaf_capacity = capacity
+        p.index_capacity = capacity
+        p.near_minimum_overlap_factor = max(1,capacity//2)
+        self.storage = storage
+        qload = False # whether the saved potential region is reopened
+        if storage is not None:
+            p.storage = rindex.RT_Disk
+            p.pagesize = pagesize
+            p.buffering_capacity = buffering
+            qload = reopen
+            if reopen and not(os.path.exists(storage+".pkl")):
+                raise FileNotFoundError("No saved potential region: "+storage)
+            p.overwrite = not(reopen)
+            # initializing the object stored on disk
+            rindex.Index.__init__(self,storage,properties=p)
+        else:
+            # initializing the object
+            rindex.Index.__init__(self,properties=p)
         self.ndim = ndim
+        self.capacity = capacity
+        self.lazy = lazy
+        self.compact = compact
+        self._pending = {}
+        self._slot = {}
+        self.extra = None
+        if storage is None:
+            dtype=np.float32 if compact else float
+            self._bids = np.zeros(capacity,dtype=np.int64)
+            self._bmins = np.zeros((capacity,ndim),dtype=dtype)
+            self._bmaxs = np.zeros((capacity,ndim),dtype=dtype)
+        else:
+            self._bids = self._bmins = self._bmaxs = None
+        if qload:
+            with open(storage+".pkl","rb") as fin:
+                self.__dict__.update(pickle.load(fin))
+            return
         # adding the first rectangle
         self.nbox = 1
         self.ncre = 1
+        self.ndel = 0
+        self.splits = {}
+        if compact:
+            # rounding the Pareto range outwards
+            ideal=[x if x<=y else float(np.nextafter(np.float32(x),-np.inf))
+                   for x,y in zip(round32(ideal),ideal)]
+            nadir=[x if x>=y else float(np.nextafter(np.float32(x),np.inf))
+                   for x,y in zip(round32(nadir),nadir)]
         # the initial box = the Pareto range
         self.insert(1,box2rindex(ideal,nadir))
+        self._slabadd(1,ideal,nadir)
         self._hypervol=hv_box(ideal,nadir)
+        if storage is not None:
+            self.flush()
+
+    ## Writes buffered pages of the disk index and the attributes to storage
+    def flush(self):
+        rindex.Index.flush(self)
+        if self.storage is not None:
+            with open(self.storage+".pkl","wb") as fout:
+                pickle.dump({"nbox": self.nbox, "ncre": self.ncre,
+                             "ndel": self.ndel, "splits": self.splits,
+                             "_hypervol": self._hypervol,
+                             "_pending": self._pending,
+                             "extra": self.extra},
+                            fout,protocol=pickle.HIGHEST_PROTOCOL)
+
+    def close(self):
+        if self.storage is not None:
+            self.flush()
+        rindex.Index.close(self)
     
+    ## Adds the box with given id and min., max. vectors to the slab
+    def _slabadd(self,rid,mn,mx):
+        if self._bids is None:
+            return
+        n=self.nbox-1 # the box is counted in nbox already
+        if n>=len(self._bids):
+            self._resize(2*len(self._bids))
+        self._bids[n]=rid
+        self._bmins[n]=mn
+        self._bmaxs[n]=mx
+        self._slot[rid]=n
+
+    ## Removes the box with given id from the slab: the last row is moved
+    #  to its place, and the slab is halved when it is less than 1/4 full
+    def _slabdel(self,rid):
+        if self._bids is None:
+            return
+        n=self.nbox # the box is not counted in nbox already
+        i=self._slot.pop(rid)
+        if i<n:
+            last=int(self._bids[n])
+            self._bids[i]=last
+            self._bmins[i]=self._bmins[n]
+            self._bmaxs[i]=self._bmaxs[n]
+            self._slot[last]=i
+        if n<len(self._bids)//4 and len(self._bids)>self.capacity:
+            self._resize(len(self._bids)//2)
+
+    ## Sets the nr. of rows of the slab
+    def _resize(self,nrows):
+        n=min(nrows,len(self._bids))
+        for s in ["_bids","_bmins","_bmaxs"]:
+            a=getattr(self,s)
+            b=np.zeros((nrows,)+a.shape[1:],dtype=a.dtype)
+            b[:n]=a[:n]
+            setattr(self,s,b)
+
+    ## Given the list of box ids, Returns the list of boxes [id, rlist vector]
+    #  from the slab
+    def _rlists(self,ids):
+        rows=[self._slot[rid] for rid in ids]
+        return [[rid,mn+mx] for rid,mn,mx in zip(ids,
+                self._bmins[rows].tolist(),self._bmaxs[rows].tolist())]
+
+    ## Returns True if the box [[min vect.],[max vect.]] with given id 
+    #  is in the index
+    def _hasbox(self,b,rid):
+        if self._bids is None:
+            return rid in self.intersection(box2rindex(*b))
+        return rid in self._slot
+
+    ## Returns arrays (ids, min. vectors, max. vectors) of all boxes in 
+    #  the potential region (boxes with pending cuts are divided first);
+    #  the arrays are views of the slab valid until the region changes
+    #  (for disk storage, new arrays of boxes read from the index)
+    def boxes_array(self):
+        for rid in list(self._pending):
+            self.materialize(rid)
+        if self._bids is None:
+            bb=[[b.id]+b.bbox for b in self.intersection(
+                    box2rindex([-np.inf for i in range(self.ndim)],
+                               [np.inf for i in range(self.ndim)]),
+                    objects=True)]
+            a=np.array(bb,dtype=float).reshape(len(bb),1+2*self.ndim)
+            return a[:,0].astype(np.int64),a[:,1:1+self.ndim], \
+                   a[:,1+self.ndim:]
+        return self._bids[:self.nbox],self._bmins[:self.nbox], \
+               self._bmaxs[:self.nbox]
+
+    ## Given the bounds lb and the list ch of box ids of an rtree leaf,
+    #  Returns the list of its boxes [id, rlist vector] in the order of ids
+    def leafboxes(self,lb,ch):
+        if self._bids is None:
+            # boxes of the disk index intersecting the bounds of the leaf
+            chs=set(ch)
+            return sorted([[b.id,b.bbox] for b in 
+                           self.intersection(lb,objects=True) if b.id in chs])
+        return self._rlists(sorted(ch))
+
     # Given a vector v, Returns the list of boxes intersecting with 
     # the dual domination cone at v, presented in rlist format:
-    # [id,[rlist mins-maxes vector]]
+    # [id,[rlist mins-maxes vector]] in the order of ids
     def _pintersect(self,v):
-        # box ids and coordinates are merged for checking uniqueness
-        inter=[# intersection with the positive cone
-            [b.id] + b.bbox for b in
-            self.intersection(
-                    box2rindex(v,[np.inf for i in range(self.ndim)]), 
-                    objects=True
-                    )
-           ]+ \
-           [# intersection with the negative cone
-            [b.id] + b.bbox for b in
-            self.intersection(
-                    box2rindex([-np.inf for i in range(self.ndim)],v), 
-                    objects=True
-                    )
-           ]
-        # list of unique intersected boxes
-        if len(inter)==0:
-            h=[]
-        else:
-            h=np.unique(inter,axis=0).tolist()
-        return [[int(i[0]),i[1:]] for i in h]  
+        cones=[[v,[np.inf for i in range(self.ndim)]],
+               [[-np.inf for i in range(self.ndim)],v]]
+        if self._bids is None:
+            # disk index: boxes of both cones, unique by integer ids
+            h={}
+            for mn,mx in cones:
+                for b in self.intersection(box2rindex(mn,mx),objects=True):
+                    h[b.id]=b.bbox
+            return [[rid,h[rid]] for rid in sorted(h)]
+        # ids of boxes intersecting the positive and the negative cone
+        # by one bulk query, unique by integer ids
+        ids,counts=self.intersection_v(
+                np.array([mn for mn,mx in cones],dtype=float),
+                np.array([mx for mn,mx in cones],dtype=float))
+        return self._rlists(np.unique(ids).tolist())
     
-    ## Given a vector v, transforms the potential region structure by taking
-    # set differences between all boxes and the dual domination cone.
-    # Returns True if the structure has changed
-    def addpoint(self,v):
-        # h is the list of boxes [id,[rlist min-max vector]] intersecting with cones
-        h=self._pintersect(v)
-        if len(h)==0:
-            print("### No intersections! Boxes: ", self.nbox," of ",self.ncre)
-            return False
-        # init the indicator if the potential region changed
-        qchange=False
+    ## Given a vector v and the list h of intersected boxes (as _pintersect),
+    # Returns the list of cuts [id, rlist vector, list of parts] of boxes
+    # by the dual domination cone, where parts of the box remaining in the
+    # potential region are given as [for each i, [min,max]]; 
+    # parts=[] if the box is removed
+    def _cuts(self,v,h):
+        cuts=[]
         ## Consider all intersected boxes one-by-one
         for b in h:
             rid=b[0] # box ID
@@ -188,10 +416,14 @@ class potreg(rindex.Index):
             nhi=0
             vrange_rec=[] # init. the list for recursive function
             for i in range(self.ndim):
-                if v[i]<vrange[i][0]: # the range belongs to the higher part
+                if v[i]<vrange[i][0] or \
+                        (self.compact and v[i]==vrange[i][0]):
+                    # the range belongs to the higher part
                     vrange_rec.append(vrange[i])
                     nhi+=1
-                elif v[i]>vrange[i][1]: # the range belongs to the lower part
+                elif v[i]>vrange[i][1] or \
+                        (self.compact and v[i]==vrange[i][1]):
+                    # the range belongs to the lower part
                     vrange_rec.append(vrange[i])
                     nlo+=1
                 else: # the vertex point is inside the range => it is undefined
@@ -199,47 +431,433 @@ class potreg(rindex.Index):
             ## Consider different cases of box-cones intersection
             # Box is a subset of a cone => removed from the potential region
             if nlo==self.ndim or nhi==self.ndim:
-                qchange=True
-                self.nbox-=1
-                self.delete(rid,rv)
-                self._hypervol-=hv_box(*rindex2box(rv))
-#                print("-  ",np.array(rindex2box(rv)[0]),"\n",
-#                      "   ",np.array(rindex2box(rv)[1])) #!#
+                cuts.append([rid,rv,[]])
             # Box does not intersect with either of the cones => do nothing 
+            # (in compact mode, the box may touch a cone on its edge)
             elif nlo>0 and nhi>0:
-                break
+                continue
             # rest of cases: box is intersected => divide into parts
             else:
-                qchange=True
-                # remove the original box
-                self.nbox-=1
-                self.delete(rid,rv)
-                self._hypervol-=hv_box(*rindex2box(rv))
-#                print("-o ",A._box_score(rindex2box(rv)),"\n",
-#                      "   ",np.array(rindex2box(rv)[0]),"\n",
-#                      "   ",np.array(rindex2box(rv)[1])) #!#
-                # insert its remaining parts
-                newboxes=flat_boxlist(divbox_rec(vrange_rec,nlo,nhi,self.ndim,0),self.ndim)
-                for c in newboxes:
-                    self.nbox+=1
-                    self.ncre+=1
-                    self.insert(self.ncre,box2rindex(*(np.array(c).T.tolist())))
-                    self._hypervol+=hv_box(*(np.array(c).T.tolist()))
-#                    print("+  ",A._box_score(rindex2box(np.array(c).T)),"\n",
-#                          "   ",np.array(c).T[0],"\n",
-#                          "   ",np.array(c).T[1]) #!#
-        return qchange
+                cuts.append([rid,rv,
+                    flat_boxlist(divbox_rec(vrange_rec,nlo,nhi,self.ndim,0),self.ndim)
+                    ])
+        return cuts
+
+    ## Removes the box with given id and rlist vector
+    def _delbox(self,rid,rv):
+        self._pending.pop(rid,None)
+        self.nbox-=1
+        self.ndel+=1
+        self._slabdel(rid)
+        self.delete(rid,rv)
+        self._hypervol-=hv_box(*rindex2box(rv))
+
+    ## Inserts the box given by min and max vectors with the id 
+    #  (by default, the next creation nr.)
+    def _newbox(self,mn,mx,rid=None):
+        if rid is None:
+            self.ncre+=1
+            rid=self.ncre
+        self.nbox+=1
+        self.insert(rid,box2rindex(mn,mx))
+        self._slabadd(rid,mn,mx)
+        self._hypervol+=hv_box(mn,mx)
+
+    ## Given a vector v, transforms the potential region structure by taking
+    # set differences between all boxes and the dual domination cone.
+    # Returns True if the structure has changed
+    def addpoint(self,v):
+        if self.compact:
+            v=round32(v)
+        # h is the list of boxes [id,[rlist min-max vector]] intersecting with cones
+        h=self._pintersect(v)
+        if len(h)==0:
+            print("### No intersections! Boxes: ", self.nbox," of ",self.ncre)
+            return False
+        if self.lazy is not None:
+            return self._addpoint_lazy(v,h)
+        cuts=self._cuts(v,h)
+        for rid,rv,parts in cuts:
+            self.splits[len(parts)]=self.splits.get(len(parts),0)+1
+            # remove the original box
+            self._delbox(rid,rv)
+            # insert its remaining parts
+            for c in parts:
+                self._newbox(*(np.array(c).T.tolist()))
+        return len(cuts)>0
+
+    ## addpoint in lazy mode for the list h of intersected boxes:
+    #  boxes inside a cone are removed, cuts of other boxes are deferred
+    def _addpoint_lazy(self,v,h):
+        for rid,rv in h:
+            mn,mx=rindex2box(rv)
+            if all(vi>x for vi,x in zip(v,mx)) or \
+                    all(vi<x for vi,x in zip(v,mn)):
+                self.splits[0]=self.splits.get(0,0)+1
+                self._delbox(rid,rv)
+            else:
+                pend=self._pending.setdefault(rid,[self._pack(rv),[],None])
+                pend[1].append(self._pack(v))
+                pend[2]=None
+                if len(pend[1])>self.lazy:
+                    self.materialize(rid)
+        return True
+
+    ## Returns the vector as kept in _pending (float32 array in compact mode)
+    def _pack(self,v):
+        return np.array(v,dtype=np.float32) if self.compact else list(v)
+
+    ## Given the rlist vector of a box and a list of cut vertices,
+    #  Returns the list of parts [min vect., max vect.] remaining after the cuts
+    def _lazyparts(self,rv,vv):
+        parts=[rindex2box(rv)]
+        for v in vv:
+            newparts=[]
+            for b in parts:
+                # the part is intersected by the dual domination cone
+                if all(x>=vi for vi,x in zip(v,b[1])) or \
+                        all(x<=vi for vi,x in zip(v,b[0])):
+                    cuts=self._cuts(v,[[0,box2rindex(*b)]])
+                    if len(cuts)>0:
+                        newparts.extend(np.array(c).T.tolist()
+                                        for c in cuts[0][2])
+                        continue
+                newparts.append(b)
+            parts=newparts
+        return parts
+
+    ## Divides the box with the given id by its pending cuts (if any)
+    #  Returns the list of boxes [[min vect.,max vect.],id] replacing the box
+    #  (the box itself if there are no pending cuts)
+    def materialize(self,rid,rv=None):
+        if rid not in self._pending:
+            return [[rindex2box(rv),rid]]
+        rv,vv,hv=self._pending[rid]
+        self._delbox(rid,rv)
+        parts=self._lazyparts(rv,vv)
+        self.splits[len(parts)]=self.splits.get(len(parts),0)+1
+        res=[]
+        for b in parts:
+            self._newbox(*b)
+            res.append([b,self.ncre])
+        return res
+
+    ## Returns the exact hypervolume of the potential region
+    def hypervol(self):
+        hv=self._hypervol
+        for pend in self._pending.values():
+            if pend[2] is None:
+                pend[2]=sum(hv_box(*b) for b in self._lazyparts(*pend[:2]))
+            hv+=pend[2]-hv_box(*rindex2box(pend[0]))
+        return hv
+
+    ## Returns the approximate nr. of bytes of the index (see index_nbytes),
+    #  the box slab (with int objects of ids and rows in _slot) and pending
+    #  cut vertices
+    def nbytes(self):
+        return index_nbytes(self.nbox,self.ndim,self.capacity)+ \
+               (0 if self._bids is None else
+                self._bids.nbytes+self._bmins.nbytes+self._bmaxs.nbytes+
+                sys.getsizeof(self._slot)+56*len(self._slot))+ \
+               sum((4 if self.compact else 8)*self.ndim*(2+len(pend[1]))
+                   for pend in self._pending.values())
+
+    ## Returns the change in the nr. of boxes if the vector v was added 
+    #  (without adding it)
+    def netboxes(self,v):
+        if self.compact:
+            v=round32(v)
+        h=self._pintersect(v)
+        return sum(len(parts)-1 for rid,rv,parts in self._cuts(v,h))
+
+    ## Given a box [[min vect.],[max vect.]] and its id, removes the box
+    #  Returns True if the box was in the potential region
+    def removebox(self,b,rid):
+        # a box with pending cuts would not exist in the eager mode
+        if rid in self._pending:
+            return False
+        if self._hasbox(b,rid):
+            self._delbox(rid,box2rindex(*b))
+            return True
+        return False
+
+    ## Given a box [[min vect.],[max vect.]], removes all boxes lying in it
+    #  (the parts into which the box was divided since it was selected)
+    #  Returns the nr. of removed boxes
+    def removein(self,b):
+        mn=np.array(b[0])
+        mx=np.array(b[1])
+        inb=[[r.id,r.bbox] for r in self.intersection(box2rindex(*b),objects=True)
+             if (np.array(r.bbox[:self.ndim])>=mn).all() and
+                (np.array(r.bbox[self.ndim:])<=mx).all()]
+        for rid,rv in inb:
+            self._delbox(rid,rv)
+        return len(inb)
     
     # Returns list of al boxes (as [ [[min vect.],[max vect.]],id ]) in the potential region 
     def boxes(self):
-        return [[rindex2box(b.bbox),b.id]
-                for b in self.intersection(
-                    box2rindex(
-                            [-np.inf for i in range(self.ndim)],
-                            [np.inf for i in range(self.ndim)]
-                                ), objects=True
-                    )
-                ]
+        ids,mins,maxs=self.boxes_array()
+        return [[[mn,mx],rid] for rid,mn,mx in
+                zip(ids.tolist(),mins.tolist(),maxs.tolist())]
+
+    ## Iterates over all boxes (as boxes) of the potential region; for disk
+    #  storage, leaf by leaf, so that only the boxes of one leaf (and the ids
+    #  of leaves' boxes) are in memory, boxes with pending cuts are divided
+    #  when they are reached
+    def iterboxes(self):
+        if self._bids is not None:
+            yield from self.boxes()
+            return
+        for lid,ch,lb in self.leaves():
+            if len(ch)>0:
+                for rid,rv in self.leafboxes(lb,ch):
+                    for box,bid in self.materialize(rid,rv):
+                        yield [box,bid]
+
+## Worker process of a shard of the potential region (see shardreg):
+#  holds a potreg without the initial box and executes commands 
+#  received through the pipe conn
+def _shard_worker(conn,ideal,nadir,capacity,bestf):
+    P=potreg(ideal,nadir,capacity)
+    P._delbox(1,box2rindex(ideal,nadir))
+    while True:
+        cmd=conn.recv()
+        if cmd[0]=="cuts": # cut own boxes by the point, send the parts
+            h=P._pintersect(cmd[1])
+            cuts=P._cuts(cmd[1],h)
+            for rid,rv,parts in cuts:
+                P._delbox(rid,rv)
+            conn.send([[rid,parts] for rid,rv,parts in cuts])
+        elif cmd[0]=="insert": # insert boxes [id, min, max]
+            for rid,mn,mx in cmd[1]:
+                P._newbox(mn,mx,rid)
+        elif cmd[0]=="remove":
+            conn.send(P.removebox(*cmd[1:]))
+        elif cmd[0]=="removein":
+            conn.send(P.removein(cmd[1]))
+        elif cmd[0]=="netboxes":
+            conn.send(P.netboxes(cmd[1]))
+        elif cmd[0]=="best": # own best box and its score
+            conn.send(bestf(P,cmd[1]) if P.nbox>0 else None)
+        elif cmd[0]=="boxes":
+            conn.send(P.boxes())
+        elif cmd[0]=="hypervol":
+            conn.send(P.hypervol())
+        elif cmd[0]=="close":
+            P.close()
+            conn.close()
+            return
+
+### Potential region sharded across worker processes.
+#   The ideal-nadir box is partitioned into nshards slabs along the first
+#   objective, and each box (not divided by slab bounds) belongs to 
+#   the worker of the slab containing its min. point. The point is 
+#   broadcast to all workers, which cut their boxes in parallel; new boxes 
+#   are numbered in the order of their parents' ids as in potreg.addpoint,
+#   so that the box set is the same as in potreg, and sent to their owners.
+#   bestf(potreg, params) -> [box, id, score] is used for the best box of
+#   each shard, it is inherited by the workers, so the fork start method is
+#   required; params (e.g. scoring parameters changed since the fork) are
+#   sent with each request (see bestbox).
+## Attributes (as in potreg)
+#   .ndim, .capacity, .nbox, .ncre, .ndel, .splits, .storage=None;
+#   .hypervol() is the sum over shards
+#   .bounds: bounds between slabs
+#   ._conns, ._procs: pipes to workers and worker processes
+class shardreg:
+    def __init__(self,ideal,nadir,nshards,bestf,capacity=16):
+        import multiprocessing as mp
+        ctx=mp.get_context("fork")
+        self.ndim=len(ideal)
+        self.capacity=capacity
+        self.storage=None
+        self.bounds=np.linspace(ideal[0],nadir[0],nshards+1)[1:-1]
+        self._conns=[]
+        self._procs=[]
+        for i in range(nshards):
+            c,cw=ctx.Pipe()
+            pr=ctx.Process(target=_shard_worker,
+                           args=(cw,ideal,nadir,capacity,bestf),daemon=True)
+            pr.start()
+            self._conns.append(c)
+            self._procs.append(pr)
+        self.nbox=0
+        self.ncre=0
+        self.ndel=0
+        self.splits={}
+        self._insert([[list(ideal),list(nadir)]])
+
+    ## Returns the nr. of the shard owning the box with the min. vector mn
+    def _owner(self,mn):
+        return int(np.searchsorted(self.bounds,mn[0],side="right"))
+
+    ## Numbers given boxes [min vect., max vect.] in turn and sends to owners
+    def _insert(self,bb):
+        ins=[[] for c in self._conns]
+        for mn,mx in bb:
+            self.ncre+=1
+            self.nbox+=1
+            ins[self._owner(mn)].append([self.ncre,mn,mx])
+        for c,l in zip(self._conns,ins):
+            if len(l)>0:
+                c.send(["insert",l])
+
+    def hypervol(self):
+        for c in self._conns:
+            c.send(["hypervol"])
+        return sum(c.recv() for c in self._conns)
+
+    ## Same as potreg.addpoint
+    def addpoint(self,v):
+        v=list(v)
+        for c in self._conns:
+            c.send(["cuts",v])
+        # cuts of all shards ordered by box id
+        cuts=sorted(sum([c.recv() for c in self._conns],[]),key=lambda x:x[0])
+        if len(cuts)==0:
+            print("### No intersections! Boxes: ", self.nbox," of ",self.ncre)
+            return False
+        self.nbox-=len(cuts)
+        self.ndel+=len(cuts)
+        for rid,parts in cuts:
+            self.splits[len(parts)]=self.splits.get(len(parts),0)+1
+        self._insert([np.array(c).T.tolist() for rid,parts in cuts for c in parts])
+        return True
+
+    ## Same as potreg.nbytes (over all shards)
+    def nbytes(self):
+        return index_nbytes(self.nbox,self.ndim,self.capacity)
+
+    ## Same as potreg.netboxes
+    def netboxes(self,v):
+        for c in self._conns:
+            c.send(["netboxes",list(v)])
+        return sum(c.recv() for c in self._conns)
+
+    ## Same as potreg.removebox
+    def removebox(self,b,rid):
+        self._conns[self._owner(b[0])].send(["remove",b,rid])
+        if self._conns[self._owner(b[0])].recv():
+            self.nbox-=1
+            self.ndel+=1
+            return True
+        return False
+
+    ## Same as potreg.removein (parts of the box may belong to any shard)
+    def removein(self,b):
+        for c in self._conns:
+            c.send(["removein",b])
+        n=sum(c.recv() for c in self._conns)
+        self.nbox-=n
+        self.ndel+=n
+        return n
+
+    ## Returns the best box [[min vect., max vect.], id] over all shards
+    #  (of boxes with equal scores, the one with the least id), the best
+    #  boxes of shards are found by bestf with params
+    def bestbox(self,params=None):
+        for c in self._conns:
+            c.send(["best",params])
+        res=[r for r in [c.recv() for c in self._conns] if r is not None]
+        return max(res,key=lambda r:(r[2],-r[1]))[:2]
+
+    def boxes(self):
+        for c in self._conns:
+            c.send(["boxes"])
+        return sum([c.recv() for c in self._conns],[])
+
+    ## Stops worker processes
+    def close(self):
+        for c,pr in zip(self._conns,self._procs):
+            c.send(["close"])
+            pr.join()
+            c.close()
+
+### Multiplicative noise of UF values, uniform in [1-perturb/2, 1+perturb/2]
+#  as in the perturbed UF of experiments, drawn from the numpy Generator rng
+#  in vectorized blocks of the given size
+## Methods
+#   .draw: returns the array of the next n multipliers
+#   .__call__: returns the next multiplier
+class ufnoise:
+    def __init__(self,rng,perturb,block=1024):
+        self.rng=rng
+        self.perturb=perturb
+        self.block=block
+        self._buf=np.zeros(0)
+        self._pos=0
+
+    def draw(self,n):
+        if self._pos+n>len(self._buf):
+            self._buf=np.concatenate([
+                    self._buf[self._pos:],
+                    1-self.perturb/2+
+                    self.rng.random(max(self.block,n))*self.perturb])
+            self._pos=0
+        res=self._buf[self._pos:self._pos+n]
+        self._pos+=n
+        return res
+
+    def __call__(self):
+        return float(self.draw(1)[0])
+
+### Multiplicative noise of UF values of solutions, uniform as in ufnoise,
+#  indexed by the solution: the multiplier of an objective vector (rounded to
+#  given decimals) is given by its hash keyed by a base key drawn from 
+#  the numpy Generator rng (counter-based, no Generator per solution), so that
+#  the same solution has the same noise in all evaluations, in any batch and,
+#  with a common rng, in all methods of a run
+## Methods
+#   .draw: returns the array of multipliers of objective vectors (rows),
+#          new ones calculated at once
+#   .__call__: returns the multiplier of an objective vector
+class solnoise:
+    def __init__(self,rng,perturb,decimals=10):
+        self.perturb=perturb
+        self.decimals=decimals
+        self._key=int(rng.integers(2**63)).to_bytes(8,"little")
+        self._cache={} # {bytes of the rounded vector: multiplier}
+
+    def draw(self,Y):
+        R=np.round(np.array(Y,dtype=float).reshape(len(Y),-1),self.decimals)
+        bb=[r.tobytes() for r in R]
+        new=[b for b in dict.fromkeys(bb) if b not in self._cache]
+        if len(new)>0:
+            # uniform numbers from 53 bits of the keyed hashes
+            h=np.frombuffer(b"".join(
+                    hashlib.blake2b(b,digest_size=8,key=self._key).digest()
+                    for b in new),dtype="<u8")
+            u=(h>>np.uint64(11))*2.0**-53
+            self._cache.update(zip(new,(1-self.perturb/2+u*self.perturb).tolist()))
+        return np.array([self._cache[b] for b in bb])
+
+    def __call__(self,y):
+        return float(self.draw([y])[0])
+
+## Returns numpy Generators of the run with the seed for UF weights, UF noise
+#  of solutions, solvers and UF noise of box scores, as independent streams
+#  derived from the seed; the noise stream of solutions is the same for all
+#  methods if crn is True (common random numbers), otherwise it depends also
+#  on the method name, as the noise stream of box scores always does (the nr.
+#  of box scores depends on the method)
+def run_streams(seed,method,crn=False):
+    ss_w,ss_noise,ss_solver,ss_box=np.random.SeedSequence(seed).spawn(4)
+    mkey=(zlib.crc32(method.encode()),)
+    if not(crn):
+        ss_noise=np.random.SeedSequence(
+                ss_noise.entropy,spawn_key=ss_noise.spawn_key+mkey)
+    ss_box=np.random.SeedSequence(ss_box.entropy,spawn_key=ss_box.spawn_key+mkey)
+    return [np.random.default_rng(ss) 
+            for ss in [ss_w,ss_noise,ss_solver,ss_box]]
+
+## Default action on memory limits of ADM (see ADM.mem_limits):
+#  warns on the soft limit, raises MemoryError on the hard limit
+def mem_warn_abort(A,level,nbytes):
+    print("### Memory limit (",level,") exceeded: ",nbytes," bytes, boxes: ",
+          A._potreg.nbox,", Pareto vectors: ",A._npareto)
+    if level=="hard":
+        raise MemoryError("Hard memory limit of ADM exceeded: "+
+                          str(nbytes)+" bytes")
 
 ### Automatic Decision Maker basic class representing ADM instance
 # interacting with a method when solving a minimization problem.
@@ -251,10 +869,45 @@ class potreg(rindex.Index):
 #   .c: coefficient of optimism (float)               
 #   ._ideal, ._nadir: corresponding points
 #   ._potreg: potential region based on potreg class
+#             (stored on disk if storage is given, see potreg, with
+#              the Pareto archive, iteration nr. and deferred updates, 
+#              which are restored if reopen is True; telemetry is not saved;
+#              or
+#              sharded across nshards worker processes, see shardreg,
+#              which does not support storage, lazy, compact and uf_noise)
 #   ._paretoset: list of nonuique Pareto objective vectors
 #   ._npareto: nr. of unique Pareto objective vectors
 #   ._uf: utility function (R^k,Ideal,Nadir -> R)
+#   .uf_monotone: True if UF is declared non-increasing in each objective
+#                 (e.g. CES of normalized objectives without perturbation)
+#   .snap_tol: None or positive tolerance relative to nadir-ideal for merging
+#              near-duplicate Pareto vectors and snapping box edges (see _upd_snap)
 #   .telemetry: dictionary of lists collecting relevant information in each iteration
+#   .memstats: True if memory telemetry is collected in each iteration:
+#              approximate bytes of the index and the Pareto archive, histogram
+#              of split fan-out, boxes [created, destroyed] by each addpoint,
+#              and the peak of allocations traced by tracemalloc since the last
+#              iteration (None if tracemalloc is not tracing; allocations of
+#              the rtree library itself are not traced)
+#   .mem_limits: None or [soft, hard] limits of approximate bytes of the index
+#                and the Pareto archive, checked after each update
+#   .compact: True if box coordinates are float32 values (see potreg.compact)
+#             and telemetry keeps Pareto vectors as float32 arrays, best boxes
+#             and preference information as boxrec and prefrec objects
+#   .uf_noise: None or ufnoise object, whose multipliers are applied to UF values
+#              of box scores (the noise is not monotone, so uf_monotone is not
+#              used with it), and to UF values of solutions if sol_noise is None
+#   .sol_noise: None or solnoise object, whose multipliers are applied to 
+#              UF values of solutions (in _upd and best_y, see _ufsol)
+#   .search_exact: False if the last best box search was stopped by a deadline
+#   ._queue: deque of updates of the potential region deferred by nextiter
+#            with a deadline, ["point", vector] or ["remove", [box, bybounds]]
+#   ._defer: True while _upd defers updates of the potential region to _queue
+#   ._selpending: True if the last best boxes were selected while updates
+#                 were pending (their removal is resolved by bounds, see _removebox)
+#   .mem_callback: function (ADM, "soft" / "hard", nr. of bytes) called
+#                  when the limit is first exceeded, e.g. for warning,
+#                  checkpointing or aborting (default mem_warn_abort)
 ## Methods
 #   ._box_score: function (box=[min vector,max vector]) -> score (float)
 #               which is used when selecting boxes
@@ -269,21 +922,72 @@ class potreg(rindex.Index):
 #   .bestbox: returns the best box [ [[min. point],[max.point]],id ] based on _box_score
 #   .nextiter: Given one or set of Pareto optima, updates the potential region
 #              and returns new preference information               
+#   ._bestbox_in: returns [box, id, score] of the best box of a given potreg
+#   ._bestbox_shard: version of _bestbox_in run by workers of shards with
+#                    scoring parameters of _score_params
+#   ._bestbox_bb: branch-and-bound version of _bestbox_in for monotone UFs
+#   .close: closes the potential region (e.g. stops workers of shards)
 
 
 
 class ADM:
-    def __init__(self,ideal,nadir,uf,coptimism):
+    def __init__(self,ideal,nadir,uf,coptimism,uf_monotone=False,
+                 storage=None,pagesize=4096,buffering=64,nshards=None,
+                 lazy=None,snap_tol=None,
+                 memstats=False,mem_limits=None,mem_callback=None,
+                 uf_noise=None,sol_noise=None,compact=False,reopen=False):
         self.k=len(ideal)
         self._ideal=ideal
         self._nadir=nadir
         self.itern=1
-        self._potreg=potreg(ideal,nadir)
         self._paretoset=[]
         self._npareto=0
         self.c=coptimism
         self._uf=uf
+        self.uf_monotone=uf_monotone
+        self.uf_noise=uf_noise
+        self.sol_noise=sol_noise
+        self._uf_exact=uf
+        if uf_noise is not None:
+            self._uf=lambda y,ideal,nadir: uf(y,ideal,nadir)*uf_noise()
+            self.uf_monotone=False
+        if snap_tol is not None and not(snap_tol>0):
+            raise ValueError("snap_tol should be positive")
+        self.snap_tol=snap_tol
+        self.memstats=memstats
+        self.mem_limits=mem_limits
+        self.mem_callback=mem_warn_abort if mem_callback is None else mem_callback
+        self._mem_level=0 # nr. of exceeded limits
+        self.search_exact=True
+        self._queue=collections.deque()
+        self._defer=False
+        self._selpending=False
+        self._addlog=[] # [created, destroyed] boxes by addpoint in the update
+        self.compact=compact
         self._box_score=self._ufbox
+        if nshards is None:
+            self._potreg=potreg(ideal,nadir,storage=storage,
+                                pagesize=pagesize,buffering=buffering,
+                                lazy=lazy,compact=compact,
+                                reopen=reopen and storage is not None)
+            if self._potreg.extra is not None:
+                # the saved state of the reopened ADM
+                self._paretoset=self._potreg.extra["paretoset"]
+                self._npareto=self._potreg.extra["npareto"]
+                self.itern=self._potreg.extra["itern"]
+                self._queue.extend(self._potreg.extra["queue"])
+                self._selpending=len(self._queue)>0
+        elif compact:
+            raise ValueError("Compact mode is not supported with shards")
+        elif storage is not None or lazy is not None:
+            raise ValueError("Disk storage and lazy mode are not supported "+
+                             "with shards")
+        elif uf_noise is not None:
+            # workers would score boxes with forked copies of the noise state
+            raise ValueError("UF noise of box scores is not supported "+
+                             "with shards")
+        else:
+            self._potreg=shardreg(ideal,nadir,nshards,self._bestbox_shard)
         self.telemetry={\
                 "hypervol": [], # hypervolume of potential region after update
                 "maxuf": [], # max. utility of newly obtained solutions
@@ -294,12 +998,38 @@ class ADM:
                 "ndifpareto":[], # number of different Pareto optima obtained in each iter.
                 "bestbox": [], # the best box selected after update
                 "ufbox":[],
-                "pref": [] # preference information generated after update
+                "changed": [], # whether the potential region changed in update
+                "nsnapped": [], # nr. of vectors merged with archived ones (snap_tol)
+                "boxes_avoided": [], # nr. of boxes avoided by snapping (snap_tol
+                                     # and memstats, None if updates were deferred)
+                "pref": [], # preference information generated after update
+                "exact": [], # False if the result of nextiter was provisional
+                # memory telemetry (memstats)
+                "index_bytes": [], # approx. bytes of the potential region index
+                "archive_bytes": [], # bytes of the Pareto archive
+                "splits": [], # {nr. of parts: nr. of split boxes} in the update
+                "addpoint_boxes": [], # [created, destroyed] by each addpoint
+                "peak_traced": [] # peak traced allocations since last iteration
                 }
+        self._splits0={}
         
 ## Return hypervolume of boxes
     def hypervol(self):
-        return self._potreg._hypervol
+        return self._potreg.hypervol()
+
+## Closes the potential region (flushes the disk storage, stops the worker
+#  processes of shards); the ADM is not usable afterwards
+    def close(self):
+        self._saveextra()
+        self._potreg.close()
+
+## Passes the state of ADM to be saved with the disk storage (see potreg.extra)
+    def _saveextra(self):
+        if self._potreg.storage is not None:
+            self._potreg.extra={"paretoset": self._paretoset,
+                                "npareto": self._npareto,
+                                "itern": self.itern,
+                                "queue": list(self._queue)}
 
 ## Calculating UF at the representative point of a box (b=[min.v,max.v])
 #  used in the basic version as the score function by default       
@@ -335,61 +1065,312 @@ class ADM:
             pp=[pp]
         ## updating Pareto optimal set
         # updating telemetry
-        self.telemetry["Pareto"].append(pp)
+        self.telemetry["Pareto"].append(
+                np.array(pp,dtype=np.float32) if self.compact else pp)
         ufmax=-np.inf
-        for pi in pp:
-            ufi=self._uf(pi,self._ideal,self._nadir)
-            #x#print("norm: ",normalize(pi,self._ideal,self._nadir))
-            #x#print("uf: ",self._uf(pi,self._ideal,self._nadir))
-            if ufi>ufmax:
-                ufmax=ufi
+        if self.sol_noise is not None:
+            # noise multipliers of the batch are calculated at once
+            ufmax=max(np.array([self._uf_exact(pi,self._ideal,self._nadir)
+                                for pi in pp])*self.sol_noise.draw(pp))
+        elif self.uf_noise is not None:
+            # noise multipliers of the batch are drawn at once
+            ufmax=max(np.array([self._uf_exact(pi,self._ideal,self._nadir)
+                                for pi in pp])*self.uf_noise.draw(len(pp)))
+        else:
+            for pi in pp:
+                ufi=self._uf(pi,self._ideal,self._nadir)
+                #x#print("norm: ",normalize(pi,self._ideal,self._nadir))
+                #x#print("uf: ",self._uf(pi,self._ideal,self._nadir))
+                if ufi>ufmax:
+                    ufmax=ufi
         self.telemetry["maxuf"].append(ufmax)
         # list of new Pareto solutions which are not in the pool
         pnew=[]
-        
-        for p in pp:
-            qincl=True
-            for p1 in self._paretoset:
-                if (p==p1).all():
-                    qincl=False
-                    break
-            if qincl:
-                pnew.append(p)
-        self._paretoset.extend(pnew)
-        self._npareto+=len(pnew)
-        # updating the potential region and calculating change indicator
-        # result (if potreg changed) of adding all Pareto points
-        qpoints=any([
-                self._potreg.addpoint(point) for point in pnew
-                ])
+        if self.snap_tol is None:
+            for p in pp:
+                qincl=True
+                for p1 in self._paretoset:
+                    if (p==p1).all():
+                        qincl=False
+                        break
+                if qincl:
+                    pnew.append(p)
+            self._paretoset.extend(pnew)
+            self._npareto+=len(pnew)
+            # updating the potential region and calculating change indicator
+            # result (if potreg changed) of adding all Pareto points
+            qpoints=any([
+                    self._addpoint(point) for point in pnew
+                    ])
+        else:
+            qpoints=self._upd_snap(pp,pnew)
         if remove_boxes is not None:
             for b in remove_boxes:
-                # print("***\n",list(self._potreg.intersection(box2rindex(*b[0]))),"\n***")
                 # if box is in the potential region
-                if b[1] in self._potreg.intersection(box2rindex(*b[0])):
-                    self._potreg._hypervol-=hv_box(*b[0])
-                    self._potreg.delete(b[1],box2rindex(*b[0]))
+                if self._removebox([b,self._selpending]):
                     qpoints=True
-                    self._potreg.nbox-=1
         return [qpoints,pnew]
 
+## Version of updating the Pareto set and potential region in _upd with
+#  snapping: vectors within snap_tol*(nadir-ideal) of an archived one (in each
+#  component) are merged with it, and new vectors are snapped to the grid with
+#  this step before cutting the potential region, so that no boxes thinner
+#  than the step appear. New vectors are appended to pnew.
+#  Snapping is not conservative: the dual domination cone is removed, and a
+#  snapped vector moved in any direction cuts away some space which the raw
+#  vector leaves (e.g. snapping up toward nadir enlarges the cone below it).
+#  Rounding to the nearest grid point keeps this error within step/2 in each
+#  component, which is the trade-off accepted for the smaller index.
+#  Returns True if the potential region changed
+    def _upd_snap(self,pp,pnew):
+        step=self.snap_tol*(np.array(self._nadir)-self._ideal)
+        nsnapped=0
+        # nr. of boxes which the raw vectors would add in addition (measured
+        # only with memstats and if updates of the potential region are not deferred)
+        avoided=0 if self.memstats and not(self._defer) else None
+        qpoints=False
+        for p in pp:
+            if len(self._paretoset)>0 and \
+                    (np.abs(np.array(self._paretoset)-p)<=step).all(axis=1).any():
+                nsnapped+=1
+                if avoided is not None:
+                    avoided+=self._potreg.netboxes(p)
+                continue
+            pnew.append(p)
+            self._paretoset.append(p)
+            self._npareto+=1
+            psnap=self._ideal+np.round((p-self._ideal)/step)*step
+            if avoided is not None:
+                avoided+=self._potreg.netboxes(p)
+            nbox0=self._potreg.nbox
+            qpoints=self._addpoint(psnap) or qpoints
+            if avoided is not None:
+                avoided-=self._potreg.nbox-nbox0
+        self.telemetry["nsnapped"].append(nsnapped)
+        self.telemetry["boxes_avoided"].append(avoided)
+        return qpoints
+
+## Adds the vector to the potential region (see potreg.addpoint),
+#  logging the nr. of boxes created and destroyed if memstats is set
+    def _addpoint(self,v):
+        if self._defer:
+            self._queue.append(["point",v])
+            return False
+        if not(self.memstats):
+            return self._potreg.addpoint(v)
+        ncre=self._potreg.ncre
+        ndel=self._potreg.ndel
+        res=self._potreg.addpoint(v)
+        self._addlog.append([self._potreg.ncre-ncre,self._potreg.ndel-ndel])
+        return res
+
+## Given [[box, id], bybounds], removes the box from the potential region
+#  (see potreg.removebox). If bybounds is True (the box was selected while
+#  updates were pending, which may have divided it since) and the box is
+#  not found, all boxes lying in its bounds are removed (see potreg.removein);
+#  cuts and removals are set differences, so the region is the same as if
+#  the box had been removed before them.
+#  Returns True if the potential region changed
+    def _removebox(self,rb):
+        if self._defer:
+            self._queue.append(["remove",rb])
+            return False
+        b,bybounds=rb
+        if self._potreg.removebox(*b):
+            return True
+        return bybounds and self._potreg.removein(b[0])>0
+
+## Applies deferred updates of the potential region in order until the time
+#  tstop (time.perf_counter value, None = all of them), at least nmin of them
+#  Returns True if the potential region changed
+    def _process(self,tstop=None,nmin=0):
+        changed=False
+        napplied=0
+        while len(self._queue)>0 and \
+                (tstop is None or napplied<nmin or time.perf_counter()<tstop):
+            napplied+=1
+            kind,x=self._queue.popleft()
+            if kind=="point":
+                changed=self._addpoint(x) or changed
+            else:
+                changed=self._removebox(x) or changed
+        return changed
+
+## Applies deferred updates of the potential region in idle time (e.g. while
+#  the decision maker considers the last preference) for at most budget
+#  seconds (None = until done); Returns the nr. of updates left
+    def idle(self,budget=None):
+        self._process(None if budget is None else time.perf_counter()+budget)
+        return len(self._queue)
+
+## Returns approximate bytes of the Pareto archive
+    def archive_nbytes(self):
+        return sys.getsizeof(self._paretoset)+ \
+               sum(sys.getsizeof(p) for p in self._paretoset)
+
+## Collects memory telemetry of the update (if memstats is set) and
+#  calls mem_callback if a memory limit is exceeded for the first time
+    def _memcheck(self):
+        if not(self.memstats) and self.mem_limits is None:
+            return
+        nbytes=[self._potreg.nbytes(),self.archive_nbytes()]
+        if self.memstats:
+            self.telemetry["index_bytes"].append(nbytes[0])
+            self.telemetry["archive_bytes"].append(nbytes[1])
+            splits=self._potreg.splits
+            self.telemetry["splits"].append(
+                    {n: c-self._splits0.get(n,0) for n,c in splits.items()
+                     if c>self._splits0.get(n,0)})
+            self._splits0=dict(splits)
+            self.telemetry["addpoint_boxes"].append(self._addlog)
+            self._addlog=[]
+            if tracemalloc.is_tracing():
+                self.telemetry["peak_traced"].append(
+                        tracemalloc.get_traced_memory()[1])
+                tracemalloc.reset_peak()
+            else:
+                self.telemetry["peak_traced"].append(None)
+        if self.mem_limits is not None:
+            soft,hard=self.mem_limits
+            level=2 if hard is not None and sum(nbytes)>hard else \
+                  1 if soft is not None and sum(nbytes)>soft else 0
+            if level>self._mem_level:
+                self._mem_level=level
+                self.mem_callback(self,["soft","hard"][level-1],sum(nbytes))
+
 ## Returns the potential region as a list of boxes [min vect. , max vect.]
 # ADM fatigue, memory etc. are modelled here 
     def potboxes(self):
         return self._potreg.boxes()
 
 ## Finds the best box based on _box_score and returns as [[min vect. , max vect.],id=ncre]
-    def bestbox(self):
-        return max(self.potboxes(),key=lambda b:self._box_score(b[0]))
+#  (the search stops at the time tstop, see _topboxes)
+    def bestbox(self,tstop=None):
+        if isinstance(self._potreg,shardreg):
+            return self._potreg.bestbox(self._score_params())
+        return self._bestbox_in(self._potreg,tstop)[:2]
+
+## Returns [box, id, score] of the best box in the potential region P
+    def _bestbox_in(self,P,tstop=None):
+        return self._topboxes(P,1,tstop)[0]
+
+## Returns the dictionary of attributes used by box scores, which workers
+#  of shards (holding copies of ADM forked at creation) set before each
+#  search; UFs given by lambdas cannot be sent, so they are fixed at creation
+    def _score_params(self):
+        params={"c": self.c, "uf_monotone": self.uf_monotone}
+        try:
+            pickle.dumps(self._uf)
+            params["_uf"]=self._uf
+        except (pickle.PicklingError,AttributeError,TypeError):
+            pass
+        return params
+
+## Same as _bestbox_in in a worker of a shard after setting the scoring
+#  parameters params (see _score_params)
+    def _bestbox_shard(self,P,params):
+        self.__dict__.update(params)
+        return self._bestbox_in(P)
+
+## Returns the list of [box, id, score] of q best boxes in the potential
+#  region P in the order of decreasing score; if the time tstop (as 
+#  time.perf_counter) is given, the search returns the best boxes found
+#  until then (at least q boxes are scored) and sets search_exact to False
+#  if it was stopped
+    def _topboxes(self,P,q,tstop=None):
+        self.search_exact=True
+        if self.uf_monotone and self._box_score==self._ufbox:
+            return self._bestbox_bb(P,q,tstop)
+        # scan of boxes keeping the min-heap of [score, -nr. of the box, box]
+        # of q best boxes (of boxes with equal scores, the first is kept);
+        # with tstop, anytime scan: q boxes at least, then until tstop
+        top=[]
+        for i,b in enumerate(P.iterboxes()):
+            if tstop is not None and i>=q and time.perf_counter()>=tstop:
+                self.search_exact=False
+                break
+            s=[self._box_score(b[0]),-i,b]
+            if len(top)<q:
+                heapq.heappush(top,s)
+            elif s[0]>top[0][0]:
+                heapq.heapreplace(top,s)
+        return [b+[score] for score,n,b in sorted(top,reverse=True)]
+
+## Branch-and-bound search of the best box (or q best boxes) for monotone UF:
+#  since UF does not increase in any objective, UF at the min. point of
+#  an rtree leaf node bounds _ufbox of all boxes in this leaf. Leaves are 
+#  visited in the order of decreasing bound, and the search stops when
+#  no remaining bound can beat the q-th best score found (or at the time tstop,
+#  once q boxes are found).
+    def _bestbox_bb(self,P,q=1,tstop=None):
+        leaves=sorted(
+                [[self._uf(np.array(lb[:self.k]),self._ideal,self._nadir),
+                  lb,ch] 
+                    for lid,ch,lb in P.leaves() if len(ch)>0],
+                key=lambda l: -l[0])
+        # min-heap of [score, -nr. of the box found, box, id] of q best boxes;
+        # of boxes with equal scores, the first found is kept
+        top=[]
+        nfound=0
+        for bound,lb,ch in leaves:
+            if len(top)==q and bound<top[0][0]:
+                break
+            if len(top)==q and tstop is not None and time.perf_counter()>=tstop:
+                self.search_exact=False
+                break
+            # boxes of the leaf in the order of ids
+            for rid,rv in P.leafboxes(lb,ch):
+                # parts of the box with pending cuts are within the leaf
+                for box,bid in P.materialize(rid,rv):
+                    score=self._box_score(box)
+                    nfound+=1
+                    if len(top)<q:
+                        heapq.heappush(top,[score,-nfound,box,bid])
+                    elif score>top[0][0]:
+                        heapq.heapreplace(top,[score,-nfound,box,bid])
+        return [[box,bid,score] for score,n,box,bid in sorted(top,reverse=True)]
+
+## Finds q best boxes based on _box_score and returns the list of 
+#  [[min vect. , max vect.],id] in the order of decreasing score.
+#  If mindist is given, boxes are selected greedily so that representative
+#  points of selected boxes are at least mindist apart (Euclidean distance
+#  in the objective space normalized by ideal and nadir)
+    def bestboxes(self,q,mindist=None,tstop=None):
+        if mindist is None:
+            if isinstance(self._potreg,shardreg):
+                if q==1:
+                    return [self._potreg.bestbox(self._score_params())]
+                return [b[:2] for b in sorted(
+                    [b+[self._box_score(b[0])] for b in self.potboxes()],
+                    key=lambda b:-b[2])[:q]]
+            return [b[:2] for b in self._topboxes(self._potreg,q,tstop)]
+        sel=[]
+        selrep=[]
+        for b in sorted(self.potboxes(),key=lambda b:-self._box_score(b[0])):
+            rep=((np.array(b[0])*[[self.c],[1-self.c]]).sum(axis=0)-
+                 self._ideal)/(np.array(self._nadir)-self._ideal)
+            if all(np.linalg.norm(rep-r)>=mindist for r in selrep):
+                sel.append(b)
+                selrep.append(rep)
+                if len(sel)==q:
+                    break
+        return sel
 
 ## Finds a best Pareto optimal vector w.r.t. UF and returns [vect.,UF(vect.)]
     def best_y(self):
         if len(self._paretoset)==0:
             return [None,None]
         y=max(self._paretoset, 
-              key = lambda yi: self._uf(yi,self._ideal,self._nadir) 
+              key = lambda yi: self._ufsol(yi) 
               )
-        return [y,self._uf(y,self._ideal,self._nadir)]
+        return [y,self._ufsol(y)]
+
+## UF value of the solution (objective vector) y, with the noise of 
+#  the solution if sol_noise is given
+    def _ufsol(self,y):
+        if self.sol_noise is None:
+            return self._uf(y,self._ideal,self._nadir)
+        return self._uf_exact(y,self._ideal,self._nadir)*self.sol_noise(y)
 
             
 ## Given one or list of objective vectors, 
@@ -397,29 +1378,118 @@ class ADM:
 #  updates the potential region and
 #  Returns {
 #           "pref": [asp. vect, reserv. vect], 
-#           "boxid": creation nr. of the best box,
-#           "nboxes": current nr. of boxes in potreg,
-#           "npareto": current nr. of Pareto objective vectors,
-#           "changed?" True if potreg changed
+#           "changed?" True if potreg changed,
+#           "bestbox": the best box (as bestbox)
 #           }
-    def nextiter(self,p,remove_boxes=None):
+#  If q is given (batch mode), the q best boxes are selected (see bestboxes,
+#  mindist is the diversity constraint), and "pref" and "bestbox" are lists
+#  of q (or fewer if the potential region has fewer boxes) elements;
+#  the Pareto vectors derived for all of them and the list of their boxes
+#  can be given in the next call.
+#  If deadline (seconds) is given, updates of the potential region are 
+#  queued and applied until the deadline, and the best box search returns
+#  the best box found until then (see _topboxes); the rest of the updates
+#  is applied in the next calls or by idle(). Then also
+#           "exact": False if the result is provisional,
+#           "npending": nr. of updates left in the queue
+#  are returned. Without deadline, updates left in the queue are applied first.
+#  At least min_updates queued updates are applied in each call, even if
+#  the deadline has passed, so that the queue is not starved; by default
+#  (None), as many as were queued in the call, so that the queue does not grow.
+#  Boxes in remove_boxes selected while updates were pending are removed
+#  with their parts divided since (see _removebox).
+#  (With snap_tol, boxes_avoided is None for deferred updates.)
+    def nextiter(self,p,remove_boxes=None,q=None,mindist=None,deadline=None,
+                 min_updates=None):
         ## updating the potential region and Pareto set
-        upnew=self._upd(p,remove_boxes)
+        if deadline is None:
+            tstop=None
+            changed=self._process()
+            upnew=self._upd(p,remove_boxes)
+        else:
+            tstop=time.perf_counter()+deadline
+            nqueue=len(self._queue)
+            self._defer=True
+            try:
+                upnew=self._upd(p,remove_boxes)
+            finally:
+                self._defer=False
+            changed=self._process(tstop,len(self._queue)-nqueue
+                                  if min_updates is None else min_updates)
+        upnew[0]=upnew[0] or changed
+        self._memcheck()
+        self.telemetry["changed"].append(upnew[0])
         self.telemetry["hypervol"].append(self.hypervol())
         self.telemetry["nboxes"].append(self._potreg.nbox)
         self.telemetry["crboxes"].append(self._potreg.ncre)
         self.telemetry["npareto"].append(self._npareto)
-        bb=self.bestbox()
-        #x# print([normalize(x,self._ideal,self._nadir) for x in bb[0]])
-        self.telemetry["bestbox"].append(bb)
-        self.telemetry["ufbox"].append(self._box_score(bb[0]))
-        newpref=self.box_pref(bb[0])
-        self.telemetry["pref"].append(newpref)
+        self.search_exact=True
+        if q is None:
+            bb=self.bestbox(tstop)
+            #x# print([normalize(x,self._ideal,self._nadir) for x in bb[0]])
+            self.telemetry["ufbox"].append(self._box_score(bb[0]))
+            newpref=self.box_pref(bb[0])
+        else:
+            bb=self.bestboxes(q,mindist,tstop)
+            # score of the best box in the batch
+            self.telemetry["ufbox"].append(self._box_score(bb[0][0]))
+            newpref=[self.box_pref(b[0]) for b in bb]
+        if not(self.compact):
+            self.telemetry["bestbox"].append(bb)
+            self.telemetry["pref"].append(newpref)
+        elif q is None:
+            self.telemetry["bestbox"].append(boxrec(*bb))
+            self.telemetry["pref"].append(self._prefrec(newpref))
+        else:
+            self.telemetry["bestbox"].append([boxrec(*b) for b in bb])
+            self.telemetry["pref"].append([self._prefrec(x) for x in newpref])
+        self._selpending=len(self._queue)>0
+        exact=self.search_exact and not(self._selpending)
+        self.telemetry["exact"].append(exact)
         self.itern+=1
-        return {"pref": newpref,
-                "changed?": upnew[0],
-                "bestbox": bb # should be also deleted for avoiding cycles
-                }
+        if self._potreg.storage is not None:
+            self._saveextra()
+            self._potreg.flush()
+        res={"pref": newpref,
+             "changed?": upnew[0],
+             "bestbox": bb # should be also deleted for avoiding cycles
+             }
+        if deadline is not None:
+            res["exact"]=exact
+            res["npending"]=len(self._queue)
+        return res
+
+## Returns preference information as prefrec if it consists of numeric 
+#  vectors of equal lengths (e.g. as _box_refpoint), otherwise unchanged
+    def _prefrec(self,pref):
+        try:
+            return prefrec(pref)
+        except (TypeError,ValueError):
+            return pref
+
+## Checks convergence criteria after nextiter, which need no knowledge
+#  of the optimal UF value (criteria set to None are not checked):
+#   hv_frac: hypervolume of the potential region is less than hv_frac of
+#            the hypervolume of the ideal-nadir box
+#   uf_tol: the best box score, i.e. the upper bound of the UF of a new solution
+#           at a representative point, exceeds UF of the best Pareto optimum
+#           by at most uf_tol (relative to its absolute value)
+#   n_nochange: the potential region has not changed in the last 
+#               n_nochange iterations
+#  Returns the description of the first satisfied criterion or None
+    def stopcrit(self,hv_frac=None,uf_tol=None,n_nochange=None):
+        if hv_frac is not None and \
+                self.hypervol()<hv_frac*hv_box(self._ideal,self._nadir):
+            return "hypervolume fraction < "+str(hv_frac)
+        if uf_tol is not None and len(self._paretoset)>0:
+            ufy=self.best_y()[1]
+            if self.telemetry["ufbox"][-1]-ufy<=uf_tol*abs(ufy):
+                return "best box score within "+str(uf_tol)+" of best UF"
+        if n_nochange is not None and \
+                len(self.telemetry["changed"])>=n_nochange and \
+                not(any(self.telemetry["changed"][-n_nochange:])):
+            return "no change in "+str(n_nochange)+" iterations"
+        return None
 
 ### ADM class for Nimbus method
 
@@ -463,18 +1533,92 @@ def normalize(xx,ideal,nadir):
     return np.array([(nad-x)/(nad-idl) for x,idl,nad in zip(xx,ideal,nadir)])
 
 
+### Archive of decision vectors of solutions for warm starts of solves
+#  in the ADM loop: solutions for nearby reference points are close 
+#  in the decision space
+## Attributes
+#   .nwarm: nr. of warm starts given to a solve
+#   .Y, .X: lists of objective and decision vectors of solutions
+## Methods
+#   .near: returns decision vectors of nwarm solutions nearest to a point
+#   .add: adds solved results of threeobj solves
+class xarchive:
+    def __init__(self,ideal,nadir,nwarm=3):
+        self._ideal=np.array(ideal,dtype=float)
+        self._range=np.array(nadir,dtype=float)-ideal
+        self.nwarm=nwarm
+        self.Y=[]
+        self.X=[]
+
+## Returns the list of decision vectors of nwarm solutions with objective
+#  vectors nearest to the point y (normalized by ideal and nadir)
+    def near(self,y):
+        if len(self.Y)==0:
+            return []
+        d=np.linalg.norm((np.array(self.Y)-np.asarray(y,dtype=float))/
+                         self._range,axis=1)
+        return [self.X[j] for j in np.argsort(d)[:self.nwarm]]
+
+## Given the list of results of threeobj.solve_ref, adds solved ones
+#  Returns the list of their objective vectors (None for unsolved)
+    def add(self,res):
+        for r in res:
+            if r["x"] is not None:
+                self.Y.append(r["y"])
+                self.X.append(r["x"][:th.nvar])
+        return [r["y"] for r in res]
+
+### Screening rule of multi-fidelity solves in the ADM loop
+#  (see threeobj.solve_ref): the screening solution is refined if it is new,
+#  i.e. farther than tol*(nadir-ideal) in some objective from all vectors
+#  of the Pareto archive of ADM and of sibling subproblems, or if its UF is
+#  within uf_tol (relative) of the best UF of the archive or above it
+class mfscreen:
+    def __init__(self,A,tol=0.05,uf_tol=0.01):
+        self.A=A
+        self.tol=tol
+        self.uf_tol=uf_tol
+
+## Returns True if the screening solution y with objective vectors of
+#  sibling subproblems should be refined
+    def refine(self,y,siblings):
+        A=self.A
+        step=self.tol*(np.array(A._nadir)-A._ideal)
+        known=list(A._paretoset)+list(siblings)
+        if len(known)==0 or \
+                not((np.abs(np.array(known)-y)<=step).all(axis=1).any()):
+            return True
+        ybest,ufbest=A.best_y()
+        return ybest is None or \
+            A._ufsol(y)>=ufbest-self.uf_tol*abs(ufbest)
+
 ## Interface for MOO methods functions
-def get_sol_nimb(pref,w,y,itern=5):
+#  warm = None or xarchive, whose solutions nearest to pref are warm starts
+#         of solves (see threeobj.solve_ref); new solutions are added to it
+#  mf = None or mfscreen for multi-fidelity solves
+def get_sol_nimb(pref,w,y,itern=5,sampl_m='simplicial',warm=None,mf=None):
+    x0=None if warm is None else warm.near(pref)
+    refine=None if mf is None else mf.refine
     if y is None:
-        return [th.solve_ref(pref,w,itern=itern)["y"]]
-    return [r["y"] 
-                for r in th.solve_nimb(pref,w,y,itern=itern)]
-def get_sol_rpm(pref,w,y,itern=5):
-    return [r["y"]
-            for r in th.solve_rpm(
-                    pref,w,
-                    sampl_m='simplicial',itern=5,npoints=100
-                    )]
+        res=[th.solve_ref(pref,w,itern=itern,sampl_m=sampl_m,x0=x0,
+                          refine=None if mf is None else
+                              lambda yi: mf.refine(yi,[]))]
+    else:
+        res=th.solve_nimb(pref,w,y,itern=itern,sampl_m=sampl_m,x0=x0,
+                          refine=refine)
+    if warm is not None:
+        warm.add(res)
+    return [r["y"] for r in res]
+def get_sol_rpm(pref,w,y,itern=5,sampl_m='simplicial',warm=None,mf=None):
+    res=th.solve_rpm(
+            pref,w,
+            sampl_m=sampl_m,itern=5,npoints=100,
+            x0=None if warm is None else warm.near(pref),
+            refine=None if mf is None else mf.refine
+            )
+    if warm is not None:
+        warm.add(res)
+    return [r["y"] for r in res]
     
 
 ############
@@ -509,157 +1653,261 @@ t=[]
 coptimism=0.5 # coefficient of optimism
 perturb = 0 # perturbation of UF (+- multiplicative)
 fold_name = "out/perturb/"
+store_name = fold_name+"experiments.sqlite" # results store of all series
 
 methods_f=[
         #get_sol_rpm,
         get_sol_nimb]
 
+## traces of method calls: recorded to trace_fold+<method name>+".pkl";
+#  in replay mode, calls found in traces are answered without solving, 
+#  which gives solver-free runs for tuning / benchmarking ADM
+trace_fold=None # folder of traces (None = no tracing)
+trace_replay=False
+
+## batch mode of ADM iterations: q_batch preference points are generated 
+#  in each iteration, and the method is called for all of them
+q_batch=None # nr. of preference points (None = one, as without batches)
+mindist_batch=None # min. normalized distance between representative points
+## tolerance for merging near-duplicate Pareto vectors in ADM, relative to
+#  nadir-ideal (None = only exact duplicates are merged)
+snap_tol=None
+## sampling method of solves ("table" = local solves from the shared table)
+sampl_m="simplicial"
+## common random numbers: the UF noise of solutions of perturbed UFs is 
+#  the same for all methods of a run (otherwise independent for each method)
+crn=False
+## memory telemetry and [soft, hard] limits in bytes of ADM (see ADM.memstats),
+#  by default a warning is printed on the soft and the run aborted on the hard limit
+memstats=False
+mem_limits=None
+## compact mode of ADM: float32 box coordinates and compact telemetry records
+compact=False
+## time budget (seconds) of ADM steps (None = exact steps, see ADM.nextiter)
+deadline=None
+## nr. of warm starts of solves from solutions of the run for the nearest
+#  reference points (None = solves from scratch, see xarchive)
+nwarm=None
+## multi-fidelity solves: tolerances of mfscreen for refinement of screening
+#  solutions (None = full-fidelity solves); screening saves evaluations 
+#  of shgo solves, but with sampl_m="table" and nwarm the full solves are 
+#  about as cheap as screening, which is then a net cost
+mf_tol=None
+mf_uf_tol=0.01
+
 itertest=10 # nr. of method iterations
 iterfail=25 # max iterations number for catching failure
 ufmax_frac=0.95 # required fraction of the maximum UF
+## convergence criteria of ADM.stopcrit (None = not used), applied after
+#  itertest iterations; note that stopping early censors nsucciter
+stop_hv_frac=None # fraction of the initial hypervolume
+stop_uf_tol=None # relative gap between best box score and best UF
+stop_n_nochange=None # nr. of iterations without change of potential region
+
+n_runs=10 # (maximum) number of experiments
+## sequential testing of paired differences between the two methods:
+#  the series stops as soon as tests for all seq_indicators are decided
+seq_indicators=["maxuf"] # pre-registered indicators to be tested
+seq_p1=0.8 # P(difference>0) under the alternative hypothesis
+seq_alpha=0.05 # two-sided type I error
+seq_beta=0.2 # type II error
+## declarative sweep over a grid of parameters (see sweep.py); cells are
+#  scheduled from the store file, so that an interrupted sweep resumes with
+#  the cells which are not done (None = the series of runs defined above)
+sweep_spec=None
+#sweep_spec={"perturb": [0,0.1], "coptimism": [0.5], "uf": [UFn],
+#            "method": ["get_sol_rpm","get_sol_nimb"],
+#            "runs": n_runs, "seed0": 0, "priority": ["run"]}
+sweep_attempts=3 # max. nr. of attempts of failed cells
+methods_all=[get_sol_rpm,get_sol_nimb] # methods available to sweeps by name
+
+## maximum UF values for (UF nr., UF weights, sampling method), so that
+#  the methods of a run share the solve
+_maxuf_values={}
 
-n_runs=10 # number of experiments
-## for collecting results
-# maximum UF fraction in itertest iterations
-maxuf_l=[[0 for m in methods_f] for i in range(n_runs)] 
-# hypervolume at the itertest iteration
-hypervol_l=[[0 for m in methods_f] for i in range(n_runs)]
-# nr. of boxes at the itertest iteration
-nboxes_l=[[0 for m in methods_f] for i in range(n_runs)]
-# nr. of solutions in the pool at the itertest iteration
-nsols_l=[[0 for m in methods_f] for i in range(n_runs)]
-# nr. of iterations before success of achieving ufmax_frac
-nsucciter_l=[[iterfail+1 for m in methods_f] for i in range(n_runs)]
+## Given the method function, UF nr. in UFs, coefficient of optimism,
+#  perturbation of UF and the seed of the run streams (see run_streams),
+#  runs ADM with the method for iterfail iterations at most,
+#  Returns the dictionary of indicators (see resstore.indicators)
+def run_experiment(getsolf,ufn,coptimism,perturb,seed):
+    global ut_mult
+    rng_w,rng_noise,rng_solver,rng_box=run_streams(seed,getsolf.__name__,crn)
+    # solvers use the global numpy stream
+    np.random.seed(int(rng_solver.integers(2**32)))
+    ut_mult=(1+rng_w.random(th.nfun)).tolist()
+    print("w = ",ut_mult)
+    key=(ufn,tuple(ut_mult),sampl_m)
+    if key not in _maxuf_values:
+        _maxuf_values[key]=-th.solve_uf(
+                lambda y: -UFs[ufn](normalize(y,th.ideal,th.nadir)),
+                sampl_m=sampl_m,itern=5
+                )[2]
+    maxuf_value=_maxuf_values[key]
+    print("Method: ",getsolf.__name__)
+    A=ADM(  
+            th.ideal,
+            th.nadir,
+            lambda y,ideal,nadir: UFs[ufn](normalize(y,ideal,nadir)),
+            coptimism,
+            uf_monotone=True,
+            # perturbation of UF
+            uf_noise=ufnoise(rng_box,perturb) if perturb>0 else None,
+            sol_noise=solnoise(rng_noise,perturb) if perturb>0 else None,
+            snap_tol=snap_tol,
+            memstats=memstats,
+            mem_limits=mem_limits,
+            compact=compact)
+    sel_boxes=[] # boxes based on which the last Pareto optima were derived
+    p=[] # initial set of current solutions
+    # solutions of the run for warm starts
+    warm=None if nwarm is None else xarchive(th.ideal,th.nadir,nwarm)
+    mf=None if mf_tol is None else mfscreen(A,mf_tol,mf_uf_tol)
+    mf_stats0=dict(th.mf_stats) # statistics of the run are differences
+    iter_fracuf=False # iteration nr. when the fraction of UF has been achieved
+    maxyuf=-np.inf
+    t_adm=0. # time spent in ADM steps
+    ## starting iterations
+    for i in range(iterfail):
+        print("Iteration ",i)
+        ## ADM step
+        t0=time.perf_counter()
+        result=A.nextiter(p,sel_boxes,q=q_batch,mindist=mindist_batch,
+                          deadline=deadline)
+        t_adm+=time.perf_counter()-t0
+        if q_batch is None:
+            sel_boxes=[result["bestbox"]]
+            prefs=[result["pref"]]
+        else:
+            sel_boxes=result["bestbox"]
+            prefs=result["pref"]
+        if i>=itertest:
+            stop=A.stopcrit(stop_hv_frac,stop_uf_tol,stop_n_nochange)
+            if stop is not None:
+                print("Converged: ",stop)
+                break
+        print("Created: ",A._potreg.ncre, ", left: ",A._potreg.nbox#,", count: ",
+              #A._potreg.count(box2rindex([-np.inf for i in range(th.nfun)],
+              #                           [np.inf for i in range(th.nfun)]))
+              )
+        #print("Preferences: (",result["bestbox"][1],")\n",pref[0],"\n",pref[1])
+        ## METHOD step
+        ycurr = A.best_y()[0] # current
+        p=sum([getsolf(np.array(pref[0]),th.w0,ycurr,sampl_m=sampl_m,
+                       warm=warm,mf=mf)
+               for pref in prefs],[])
+        p=np.unique([ip for ip in p if ip is not None], axis=0)
+        A.telemetry["ndifpareto"].append(len(p))
+        curr_uf=max([UFs[ufn](normalize(y,th.ideal,th.nadir)) for y in p])
+        if curr_uf>maxyuf and i<itertest:
+            maxyuf=curr_uf
+        if not(iter_fracuf) and curr_uf/maxuf_value>=ufmax_frac:
+            iter_fracuf=i+1
+        if i>=itertest-1 and iter_fracuf:
+            break
+    # collect ADM stats at t
+    result=A.nextiter(p,sel_boxes,q=q_batch,mindist=mindist_batch)
+    A.close()
+    print("ADM time: ",t_adm)
+    if mf is not None:
+        mf_run={s:th.mf_stats[s]-mf_stats0[s] for s in th.mf_stats}
+        print("Multi-fidelity: ",mf_run,", saved evaluations: ",
+              th.mf_saved(mf_run))
+    if trace_fold is not None:
+        print("Trace calls replayed: ",getsolf.nhit,", solved: ",getsolf.nmiss)
+        getsolf.save(trace_fold+getsolf.__name__+".pkl")
+    return {"maxuf": maxyuf/maxuf_value,
+            "hypervol": A.telemetry["hypervol"][itertest-1],
+            "nboxes": A.telemetry["nboxes"][itertest-1],
+            "nsols": A.telemetry["npareto"][itertest],
+            # failure to achieve ufmax_frac is given as iterfail+1
+            "nsucciter": iter_fracuf or iterfail+1}
+
+## Wraps method functions by traces of their calls if trace_fold is given
+def traced(methods):
+    if trace_fold is None:
+        return methods
+    os.makedirs(trace_fold,exist_ok=True)
+    methods=[at.methtrace(m,replay=trace_replay) for m in methods]
+    for m in methods:
+        if os.path.exists(trace_fold+m.__name__+".pkl"):
+            m.load(trace_fold+m.__name__+".pkl")
+    return methods
 
 nseries=10 # series of experiments for smaller batches
-for iex in range(n_runs):
-    ut_mult=[1+np.random.rand() for i in range(th.nfun)]
-    print("\n*****\nRun ",iex,":\nw = ",ut_mult)
-    maxuf_value=-th.solve_uf(
-            lambda y: -UFs[UFn](normalize(y,th.ideal,th.nadir)),
-            itern=5
-            )[2]
-    for mi, getsolf in enumerate(methods_f):
-        print("Method: ",getsolf.__name__)
-        A=ADM(  
-                th.ideal,
-                th.nadir,
-                lambda y,ideal,nadir: UFs[UFn](normalize(y,ideal,nadir))* \
-                                      (1-perturb/2+np.random.rand()*perturb),
-                coptimism)
-        sel_box=None # box based on which the last Pareto optimum was derived    
-        p=[] # initial set of current solutions
-        iter_fracuf=False # iteration nr. when the fraction of UF has been achieved
-        maxyuf=-np.inf
-        ## starting iterations
-        for i in range(iterfail):
-            print("Iteration ",i)
-            ## ADM step
-            result=A.nextiter(p,[sel_box])
-            sel_box=result["bestbox"]
-            print("Created: ",A._potreg.ncre, ", left: ",A._potreg.nbox#,", count: ",
-                  #A._potreg.count(box2rindex([-np.inf for i in range(th.nfun)],
-                  #                           [np.inf for i in range(th.nfun)]))
-                  )
-            pref=np.array(result["pref"][0])
-            #print("Preferences: (",result["bestbox"][1],")\n",pref[0],"\n",pref[1])
-            ## METHOD step
-            ycurr = A.best_y()[0] # current
-            p=getsolf(pref,th.w0,ycurr)
-            p=np.unique([ip for ip in p if ip is not None], axis=0)
-            A.telemetry["ndifpareto"].append(len(p))
-            curr_uf=max([UFs[UFn](normalize(y,th.ideal,th.nadir)) for y in p])
-            if curr_uf>maxyuf and i<itertest:
-                maxyuf=curr_uf
-            if not(iter_fracuf) and curr_uf/maxuf_value>=ufmax_frac:
-                iter_fracuf=i+1
-            if i>=itertest-1 and iter_fracuf:
+if __name__=="__main__" and sweep_spec is not None:
+    os.makedirs(fold_name,exist_ok=True)
+    getsolfs={m.__name__: m for m in traced(methods_all)}
+    sched=sw.scheduler(store_name,sweep_spec,max_attempts=sweep_attempts)
+    print("Cells: ",sched.summary())
+    sched.run(lambda perturb,coptimism,uf,method,run,seed:
+              run_experiment(getsolfs[method],uf,coptimism,perturb,seed))
+    print("Cells: ",sched.summary())
+    sched.close()
+elif __name__=="__main__":
+    ## for collecting results
+    # maximum UF fraction in itertest iterations
+    maxuf_l=[[0 for m in methods_f] for i in range(n_runs)] 
+    # hypervolume at the itertest iteration
+    hypervol_l=[[0 for m in methods_f] for i in range(n_runs)]
+    # nr. of boxes at the itertest iteration
+    nboxes_l=[[0 for m in methods_f] for i in range(n_runs)]
+    # nr. of solutions in the pool at the itertest iteration
+    nsols_l=[[0 for m in methods_f] for i in range(n_runs)]
+    # nr. of iterations before success of achieving ufmax_frac
+    nsucciter_l=[[iterfail+1 for m in methods_f] for i in range(n_runs)]
+    
+    os.makedirs(fold_name,exist_ok=True)
+    store=rs.resstore(store_name)
+    seq_tests={s:sq.sprt_sign(seq_p1,seq_alpha,seq_beta) for s in seq_indicators}
+    methods_f=traced(methods_f)
+    stop_reason="maximum nr. of runs "+str(n_runs)
+    for iex in range(n_runs):
+        # seed of the run, unique across series
+        seed=nseries*n_runs+iex
+        print("\n*****\nRun ",iex)
+        for mi, getsolf in enumerate(methods_f):
+            res=run_experiment(getsolf,UFn,coptimism,perturb,seed)
+            maxuf_l[iex][mi]=res["maxuf"]
+            hypervol_l[iex][mi]=res["hypervol"]
+            nboxes_l[iex][mi]=res["nboxes"]
+            nsols_l[iex][mi]=res["nsols"]
+            nsucciter_l[iex][mi]=res["nsucciter"]
+            ## saving results of the run
+            store.add(perturb,coptimism,UFn,getsolf.__name__,iex,seed,**res)
+        ## updating sequential tests with differences between the two methods
+        if len(methods_f)==2:
+            res_run={"maxuf":maxuf_l[iex],"hypervol":hypervol_l[iex],
+                     "nboxes":nboxes_l[iex],"nsols":nsols_l[iex],
+                     "nsucciter":nsucciter_l[iex]}
+            for s,t in seq_tests.items():
+                t.add(res_run[s][0]-res_run[s][1])
+                print("Sequential test ",s,": n=",t.n,", mean diff.=",t.mean,
+                      ", LLR=",t.llr(),", decision: ",t.decision)
+            if all(t.decision is not None for t in seq_tests.values()):
+                stop_reason="sequential test decided after "+str(iex+1)+\
+                    " runs: "+", ".join(s+" "+t.decision
+                                        for s,t in seq_tests.items())
                 break
-        # collect ADM stats at t
-        result=A.nextiter(p,[sel_box])
-        maxuf_l[iex][mi]=maxyuf/maxuf_value
-        hypervol_l[iex][mi]=A.telemetry["hypervol"][itertest-1]
-        nboxes_l[iex][mi]=A.telemetry["nboxes"][itertest-1]
-        nsols_l[iex][mi]=A.telemetry["npareto"][itertest]
-        nsucciter_l[iex][mi]=iter_fracuf
-#            
-## saving results
-#with open(
-#        fold_name+"experiments_"+
-#        str(perturb).replace(".","")+
-#        "_"+str(nseries)+
-#        ".pkl",
-#        "wb") as fout:
-#    pickle.dump(
-#            {
-#                "maxuf":maxuf_l,
-#                "hypervol":hypervol_l,
-#                "nboxes":nboxes_l,
-#                "nsols":nsols_l,
-#                "nsucciter":nsucciter_l
-#                    },
-#            fout,protocol=pickle.HIGHEST_PROTOCOL)
+    n_done=iex+1
+    for d in [maxuf_l,hypervol_l,nboxes_l,nsols_l,nsucciter_l]:
+        del d[n_done:]
+    print("Stopped: ",stop_reason)
+    store.close()
     
-### multi-experiments: collecting results
-## maximum UF fraction in itertest iterations
-#maxuf_l=[] 
-## hypervolume at the itertest iteration
-#hypervol_l=[]
-## nr. of boxes at the itertest iteration
-#nboxes_l=[]
-## nr. of solutions in the pool at the itertest iteration
-#nsols_l=[]
-## nr. of iterations before success of achieving ufmax_frac
-#nsucciter_l=[]
-#
+### multi-experiments: collecting results of all series from the store
 #methnames=["RPM","Nimbus"]
-#for s in os.listdir(fold_name):
-#    if s.endswith(".pkl"):
-#        with open(fold_name+s,"rb") as f:
-#            d=pickle.load(f)
-#            maxuf_l.extend(d["maxuf"])
-#            hypervol_l.extend(d["hypervol"])
-#            nboxes_l.extend(d["nboxes"])
-#            nsols_l.extend(d["nsols"])
-#            nsucciter_l.extend(d["nsucciter"])        
-#for d,dname in zip([maxuf_l,hypervol_l,nboxes_l,nsols_l,nsucciter_l],
-#                   ["maxuf_l","hypervol_l","nboxes_l","nsols_l","nsucciter_l"]):
-#    print(dname,": ",wilcoxon(*list(map(list, zip(*d))))[1])
-    
-#
-#w=xlsxwriter.Workbook(fold_name+"out100.xlsx")
-#sh=w.add_worksheet("Out")
-#sh.write(0,0,"Value function")
-#for i,s in enumerate(methnames):
-#    sh.write(1,i,s)
-#for i,l in enumerate(maxuf_l):
-#    for j,x in enumerate(l):
-#        sh.write(i+2,j,x)
-#sh.write(0,2,"Success iteration")        
-#for i,s in enumerate(methnames):
-#    sh.write(1,i+2,s)
-#for i,l in enumerate(nsucciter_l):
-#    for j,x in enumerate(l):
-#        sh.write(i+2,j+2,x)
-#sh.write(0,4,"Hypervolume")        
-#for i,s in enumerate(methnames):
-#    sh.write(1,i+4,s)
-#for i,l in enumerate(hypervol_l):
-#    for j,x in enumerate(l):
-#        sh.write(i+2,j+4,x)
-#sh.write(0,6,"Number of boxes")
-#for i,s in enumerate(methnames):
-#    sh.write(1,i+6,s)
-#for i,l in enumerate(nboxes_l):
-#    for j,x in enumerate(l):
-#        sh.write(i+2,j+6,x)
-#sh.write(0,8,"Number of solutions")
-#for i,s in enumerate(methnames):
-#    sh.write(1,i+8,s)
-#for i,l in enumerate(nsols_l):
-#    for j,x in enumerate(l):
-#        sh.write(i+2,j+8,x)
-#w.close()
+#store=rs.resstore(store_name)
+#for dname in rs.indicators:
+#    print(dname,": ",wilcoxon(
+#            *store.paired(dname,["get_sol_rpm","get_sol_nimb"],
+#                          perturb=perturb,uf=UFn)
+#            )[1])
+#sections=rp.store_sections(store,["get_sol_rpm","get_sol_nimb"],methnames,
+#                           perturb=perturb,uf=UFn)
+#store.close()
+#rp.write_xlsx(fold_name+"out100.xlsx",{"Out": sections})
+## faster alternative
+##rp.write_csv(fold_name+"out100.csv",sections)
 #
 #
 #
@@ -690,12 +1938,9 @@ for iex in range(n_runs):
 #        "sol. funct":[get_sol_rpm,get_sol_nimb]
 #        }
 #        }
-## DataFrame for collecting outputs
-#Dout=pd.DataFrame(columns=pd.MultiIndex.from_product(
-#        [configs[k]["names"] for k in configs],
-#        names=[k for k in configs]
-#        )
-#                  ) 
+## columns of outputs: {ADM name: {indicator: {method: array}}}
+#Dout={cname:{ind:{} for ind in configs["Indicators"]["names"]}
+#      for cname in configs["ADMs"]["names"]}
 
 #
 #fig0,ax0=plt.subplots(figsize=(8,6))
@@ -749,15 +1994,16 @@ for iex in range(n_runs):
 #            p=np.unique([ip for ip in p if ip is not None], axis=0)
 #            #print("solution:\n",p,"\n")
 #        A.nextiter(p,[sel_box])
-#        Dout.loc[:,(cname,"Max. VF",mname)]=[y/maxuf_value for y in A.telemetry["maxuf"]]
-#        Dout.loc[:,(cname,"Nr. sols.",mname)]=A.telemetry["npareto"][1:]
-#        Dout.loc[:,(cname,"Volume",mname)]=A.telemetry["hypervol"][1:]
-#        Dout.loc[:,(cname,"Nr. boxes",mname)]=A.telemetry["nboxes"][1:]
+#        Dout[cname]["Max. VF"][mname]=np.array(A.telemetry["maxuf"])/maxuf_value
+#        Dout[cname]["Nr. sols."][mname]=np.array(A.telemetry["npareto"][1:])
+#        Dout[cname]["Volume"][mname]=np.array(A.telemetry["hypervol"][1:])
+#        Dout[cname]["Nr. boxes"][mname]=np.array(A.telemetry["nboxes"][1:])
         
 ## Writing to Excel
-#with pd.ExcelWriter("out.xlsx") as f:
-#    for cname in configs["ADMs"]["names"]:
-#        Dout[cname].to_excel(f,sheet_name=cname)
+#rp.write_xlsx("out.xlsx",{
+#        cname:[(ind,list(d),np.column_stack(list(d.values())))
+#               for ind,d in Dout[cname].items()]
+#        for cname in configs["ADMs"]["names"]})
 
 
 #        out.append({
@@ -0,0 +1,107 @@
+### Trace recording and replay of MOO method calls in ADM experiments
+#  A method function with the signature of get_sol_nimb / get_sol_rpm
+#      getsolf(pref,w,y,**kwargs) -> list of Pareto objective vectors
+#  is wrapped by methtrace, which records each call (preference point, weights,
+#  current solution, solver settings and returned vectors). In replay mode, 
+#  calls found in the trace with the same settings are answered from it without
+#  solving, the rest are solved (or refused if fallback is False) and added
+#  to the trace.
+import pickle
+import numpy as np
+
+## Returns the hashable form of a keyword argument of a method function:
+#  numbers, strings and None as they are, arrays as rounded tuples, other
+#  objects (e.g. adm2.xarchive, adm2.mfscreen) as their class name with
+#  their attributes of these kinds
+def setting(v,decimals=10):
+    if v is None or isinstance(v,(bool,int,float,str)):
+        return v
+    if isinstance(v,(list,tuple,np.ndarray)):
+        try:
+            return tuple(np.round(np.asarray(v,dtype=float),decimals)
+                         .ravel().tolist())
+        except (TypeError,ValueError):
+            return None
+    return (type(v).__name__,)+tuple(
+            (s,x) for s,x in sorted(vars(v).items()) 
+            if x is None or isinstance(x,(bool,int,float,str)))
+
+## Returns the hashable settings of the call (keyword arguments kwargs)
+def call_settings(kwargs,decimals=10):
+    return tuple((s,setting(v,decimals)) for s,v in sorted(kwargs.items()))
+
+## Returns the hashable key of the call, with arrays rounded to given decimals,
+#  and settings (as call_settings)
+def call_key(pref,w,y,decimals=10,settings=()):
+    return tuple(
+            None if a is None else
+            tuple(np.round(np.asarray(a,dtype=float),decimals).tolist())
+            for a in [pref,w,y])+(settings,)
+
+### Wrapper of a method function recording / replaying its calls
+## Attributes
+#   .getsolf: the wrapped method function
+#   .__name__: name of the wrapped function (used e.g. in results store)
+#   .replay: True iff calls are answered from the trace when possible
+#   .fallback: True iff missing calls are solved in replay mode
+#   .decimals: nr. of decimals for matching calls
+#   .calls: list of recorded calls [pref,w,y,list of Pareto vectors,settings]
+#           in order (settings as call_settings of keyword arguments)
+#   .nhit, .nmiss: nr. of calls answered from the trace / solved
+#   ._index: dictionary call key -> index in .calls
+## Methods
+#   .save, .load: saving / loading the trace to / from a pickle file
+class methtrace:
+    def __init__(self,getsolf,replay=False,fallback=True,decimals=10):
+        self.getsolf=getsolf
+        self.__name__=getsolf.__name__
+        self.replay=replay
+        self.fallback=fallback
+        self.decimals=decimals
+        self.calls=[]
+        self.nhit=0
+        self.nmiss=0
+        self._index={}
+
+    def __call__(self,pref,w,y,**kwargs):
+        settings=call_settings(kwargs,self.decimals)
+        key=call_key(pref,w,y,self.decimals,settings)
+        if self.replay and key in self._index:
+            self.nhit+=1
+            return [None if p is None else np.array(p)
+                    for p in self.calls[self._index[key]][3]]
+        if self.replay and not(self.fallback):
+            raise KeyError("Call is not in the trace: pref="+str(pref)+
+                           ", settings="+str(settings))
+        self.nmiss+=1
+        res=self.getsolf(pref,w,y,**kwargs)
+        self._index[key]=len(self.calls)
+        self.calls.append([
+                np.array(pref,dtype=float),
+                np.array(w,dtype=float),
+                None if y is None else np.array(y,dtype=float),
+                [None if p is None else np.array(p,dtype=float) for p in res],
+                settings
+                ])
+        return res
+
+    def save(self,fname):
+        with open(fname,"wb") as fout:
+            pickle.dump({"name": self.__name__,"calls": self.calls},
+                        fout,protocol=pickle.HIGHEST_PROTOCOL)
+
+## Loads calls from the file and adds them to the trace
+#  (calls of traces saved without settings are matched only by calls 
+#  without keyword arguments)
+    def load(self,fname):
+        with open(fname,"rb") as fin:
+            d=pickle.load(fin)
+        if d["name"]!=self.__name__:
+            raise ValueError("Trace of "+d["name"]+" cannot be used for "+
+                             self.__name__)
+        for c in d["calls"]:
+            key=call_key(*c[:3],decimals=self.decimals,
+                         settings=c[4] if len(c)>4 else ())
+            if key not in self._index:
+                self._index[key]=len(self.calls)
+                self.calls.append(c)
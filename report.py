@@ -0,0 +1,73 @@
+### Report export for experiment results
+#  Results are given as columnar numpy arrays grouped in sections
+#      [(title, [column names], 2D array with one column per name), ...]
+#  placed side by side in a sheet: title in row 0, column names in row 1,
+#  values from row 2. Excel output uses the constant memory mode of xlsxwriter,
+#  so that only the current row is kept in memory; CSV and Parquet outputs
+#  are faster alternatives with flat "title: column" headers.
+import numpy as np
+import xlsxwriter
+
+## Sections of the multi-experiment report: (title, indicator in resstore)
+multiexp_sections=[
+        ("Value function","maxuf"),
+        ("Success iteration","nsucciter"),
+        ("Hypervolume","hypervol"),
+        ("Number of boxes","nboxes"),
+        ("Number of solutions","nsols")
+        ]
+
+## Given a resstore object, list of methods and their names in the report,
+#  Returns sections of the multi-experiment report with paired results
+#  for records with given key field values
+def store_sections(store,methods,methnames,**filt):
+    return [(title,methnames,
+             np.column_stack(store.paired(ind,methods,**filt)))
+            for title,ind in multiexp_sections]
+
+## Returns the 2D array of values of sections padded by NaN to the same
+#  nr. of rows, and the lists of titles and column names for each column
+def _table(sections):
+    nrows=max([len(a) for t,c,a in sections]+[0])
+    titles=[]
+    cols=[]
+    blocks=[]
+    for title,colnames,a in sections:
+        a=np.asarray(a,dtype=float).reshape(len(a),len(colnames))
+        blocks.append(np.vstack([a,np.full((nrows-len(a),len(colnames)),np.nan)]))
+        titles.extend([title]+["" for i in colnames[1:]])
+        cols.extend(colnames)
+    if len(blocks)==0:
+        return np.zeros((0,0)),[],[]
+    return np.hstack(blocks),titles,cols
+
+## Given the file name and dictionary {sheet name: sections},
+#  writes the Excel workbook row by row in constant memory mode
+def write_xlsx(fname,sheets):
+    wb=xlsxwriter.Workbook(fname,{"constant_memory": True})
+    for sname,sections in sheets.items():
+        sh=wb.add_worksheet(sname)
+        tab,titles,cols=_table(sections)
+        sh.write_row(0,0,titles)
+        sh.write_row(1,0,cols)
+        for i,row in enumerate(tab.tolist()):
+            # missing values (NaN) are left as blank cells
+            sh.write_row(i+2,0,[None if x!=x else x for x in row])
+    wb.close()
+
+## Given the file name and sections, writes the CSV file
+def write_csv(fname,sections):
+    tab,titles,cols=_table(sections)
+    np.savetxt(fname,tab,delimiter=",",comments="",
+               header=",".join(_flatnames(sections)))
+
+## Given the file name and sections, writes the Parquet file
+#  (requires pandas with pyarrow or fastparquet)
+def write_parquet(fname,sections):
+    import pandas as pd
+    tab,titles,cols=_table(sections)
+    pd.DataFrame(tab,columns=_flatnames(sections)).to_parquet(fname)
+
+## Returns the list of flat column names "title: column" of sections
+def _flatnames(sections):
+    return [title+": "+c for title,colnames,a in sections for c in colnames]
@@ -0,0 +1,118 @@
+### Results store for multi-experiments
+#  All runs are appended to a single SQLite file as rows keyed by
+#  (perturb, coptimism, uf, method, run, seed), one column per indicator.
+#  The file is opened in WAL mode, so that parallel workers (each with its own
+#  resstore object) can append concurrently, and indicator columns can be
+#  queried as numpy arrays directly, e.g. for wilcoxon tests.
+import sqlite3
+import numpy as np
+
+## key fields of an experiment record
+keys=["perturb","coptimism","uf","method","run","seed"]
+## indicators collected in each experiment record
+#  (nsucciter of a run failing to achieve ufmax_frac is iterfail+1)
+indicators=["maxuf","hypervol","nboxes","nsols","nsucciter"]
+
+### Append-only experiment results store
+## Attributes
+#   .fname: name of the SQLite file
+#   ._con: connection to the database
+## Methods
+#   .add: appends the record of one run of one method
+#   .column: returns values of one indicator as numpy array
+#   .paired: returns values of one indicator for several methods,
+#            matched by the other key fields (for paired tests)
+#   .done: returns True iff the record with given key exists
+class resstore:
+    def __init__(self,fname,timeout=60.):
+        self.fname=fname
+        # waiting up to timeout seconds when another writer locks the file
+        self._con=sqlite3.connect(fname,timeout=timeout)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        with self._con:
+            self._con.execute(
+                "CREATE TABLE IF NOT EXISTS results ("+
+                "perturb REAL, coptimism REAL, uf INTEGER, method TEXT, "+
+                "run INTEGER, seed INTEGER, "+
+                ", ".join(s+" REAL" for s in indicators)+
+                ", PRIMARY KEY ("+", ".join(keys)+"))"
+                )
+
+## Given key fields and indicator values (missing ones are stored as NULL),
+#  appends the record; Returns False if the record already exists
+    def add(self,perturb,coptimism,uf,method,run,seed,**ind):
+        for s in ind:
+            if s not in indicators:
+                raise ValueError("Unknown indicator: "+s)
+        with self._con:
+            cur=self._con.execute(
+                "INSERT OR IGNORE INTO results VALUES ("+
+                ",".join("?" for i in range(len(keys)+len(indicators)))+")",
+                [float(perturb),float(coptimism),int(uf),method,int(run),
+                 int(seed)]+
+                [None if ind.get(s) is None else float(ind[s])
+                    for s in indicators]
+                )
+        return cur.rowcount>0
+
+## Returns True iff the record with the given key fields exists
+    def done(self,perturb,coptimism,uf,method,run,seed):
+        return self._con.execute(
+                "SELECT 1 FROM results WHERE "+
+                " AND ".join(s+"=?" for s in keys),
+                [float(perturb),float(coptimism),int(uf),method,int(run),
+                 int(seed)]
+                ).fetchone() is not None
+
+## Creates the WHERE clause and its parameters for given key field values
+    @staticmethod
+    def _where(filt):
+        for s in filt:
+            if s not in keys:
+                raise ValueError("Unknown key field: "+s)
+        if len(filt)==0:
+            return "",[]
+        return " WHERE "+" AND ".join(s+"=?" for s in filt), list(filt.values())
+
+## Returns values of indicator "name" as a numpy array ordered by
+#  (perturb, coptimism, uf, run, seed)
+#  for records with given key field values (e.g. method="get_sol_rpm")
+    def column(self,name,**filt):
+        if name not in indicators:
+            raise ValueError("Unknown indicator: "+name)
+        w,par=self._where(filt)
+        return np.array(
+                self._con.execute(
+                    "SELECT "+name+" FROM results"+w+
+                    " ORDER BY perturb, coptimism, uf, run, seed",
+                    par).fetchall(),
+                dtype=float).reshape(-1)
+
+## Returns the list of numpy arrays of indicator "name" for each of methods,
+#  including only records which exist for all methods, matched by other keys
+    def paired(self,name,methods,**filt):
+        if name not in indicators:
+            raise ValueError("Unknown indicator: "+name)
+        if "method" in filt:
+            raise ValueError("Methods are given in a separate argument")
+        other=[s for s in keys if s!="method"]
+        par=self._where(filt)[1]
+        # self-join of the table for each method on other key fields
+        q=("SELECT "+", ".join("t"+str(i)+"."+name
+                              for i in range(len(methods)))+
+           " FROM "+", ".join("results t"+str(i)
+                             for i in range(len(methods)))+
+           " WHERE "+" AND ".join("t"+str(i)+".method=?"
+                                 for i in range(len(methods)))+
+           "".join(" AND t0."+s+"=t"+str(i)+"."+s
+                   for i in range(1,len(methods)) for s in other)+
+           "".join(" AND t0."+s+"=?" for s in filt)+
+           " ORDER BY "+", ".join("t0."+s for s in other)
+           )
+        res=np.array(
+                self._con.execute(q,list(methods)+par).fetchall(),
+                dtype=float).reshape(-1,len(methods))
+        return [res[:,i] for i in range(len(methods))]
+
+    def close(self):
+        self._con.close()
@@ -0,0 +1,67 @@
+### Sequential tests for paired experiment results
+#  used for stopping a series of runs as soon as the comparison of two
+#  methods is decided instead of running a fixed number of runs
+import numpy as np
+
+### Wald's sequential probability ratio test on signs of paired differences
+#  (sequential sign test), two-sided:
+#      H0: P(d>0)=1/2  against  H1+: P(d>0)=p1  and  H1-: P(d>0)=1-p1,
+#  each one-sided test has type I error alpha/2 and type II error beta.
+#  Ties (d==0) carry no information about the sign and are discarded.
+#  The test parameters should be fixed before the experiment (pre-registered).
+## Attributes
+#   .n: nr. of paired differences added
+#   .mean, .var: mean and sample variance of paired differences (online)
+#   .npos, .nneg: nr. of positive / negative differences
+#   .decision: None while undecided, otherwise "H0", "H1+" or "H1-"
+## Methods
+#   .add: adds a paired difference, updates the statistics and the decision
+#   .llr: returns log-likelihood ratios of H1+ and H1- against H0
+class sprt_sign:
+    def __init__(self,p1=0.8,alpha=0.05,beta=0.2):
+        if not(0.5<p1<1):
+            raise ValueError("p1 should be in (0.5,1)")
+        self.p1=p1
+        self.alpha=alpha
+        self.beta=beta
+        # Wald's bounds for the log-likelihood ratio
+        self._lo=np.log(beta/(1-alpha/2))
+        self._hi=np.log((1-beta)/(alpha/2))
+        self.n=0
+        self.mean=0.
+        self._m2=0. # sum of squared deviations from the mean
+        self.npos=0
+        self.nneg=0
+        self.decision=None
+
+    @property
+    def var(self):
+        return self._m2/(self.n-1) if self.n>1 else np.nan
+
+## Returns [LLR of H1+ vs. H0, LLR of H1- vs. H0]
+    def llr(self):
+        lp=np.log(2*self.p1)
+        ln=np.log(2*(1-self.p1))
+        return [float(self.npos*lp+self.nneg*ln), float(self.npos*ln+self.nneg*lp)]
+
+## Given a paired difference d, updates statistics,
+#  Returns the decision (None if undecided)
+    def add(self,d):
+        # Welford's update of mean and variance
+        self.n+=1
+        delta=d-self.mean
+        self.mean+=delta/self.n
+        self._m2+=delta*(d-self.mean)
+        if d>0:
+            self.npos+=1
+        elif d<0:
+            self.nneg+=1
+        if self.decision is None:
+            lpos,lneg=self.llr()
+            if lpos>=self._hi:
+                self.decision="H1+"
+            elif lneg>=self._hi:
+                self.decision="H1-"
+            elif lpos<=self._lo and lneg<=self._lo:
+                self.decision="H0"
+        return self.decision
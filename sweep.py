@@ -0,0 +1,163 @@
+### Resumable sweeps over parameter grids of experiments
+#  A sweep spec (dictionary) defines the grid of cells:
+#     {"perturb": [...], "coptimism": [...], "uf": [...], "method": [...],
+#      "runs": nr. of runs, "seed0": seed of the run 0,
+#      "priority": list of fields ordering the cells (default ["run"])}
+#  Each cell is one run of one method with one combination of parameters,
+#  with seed = seed0 + run, so that the cells of one run use the same seed.
+#  States of the cells are kept in the table "cells" of the results store file
+#  (see resstore): "pending", "running", "done" or "failed", so that an
+#  interrupted sweep resumes from the cells which are not done.
+import itertools
+import os
+import sqlite3
+import traceback
+import resstore as rs
+
+states=["pending","running","done","failed"]
+
+## Returns the list of cells (dictionaries of resstore.keys) of the sweep spec
+#  in the priority order: by the fields of spec["priority"], then by the grid
+def cells(spec):
+    grid=[dict(zip(["perturb","coptimism","uf","method","run"],c))
+          for c in itertools.product(
+                  spec["perturb"],spec["coptimism"],spec["uf"],spec["method"],
+                  range(spec["runs"]))]
+    for c in grid:
+        c["seed"]=spec.get("seed0",0)+c["run"]
+    prio=spec.get("priority",["run"])
+    return sorted(grid,key=lambda c: [c[s] for s in prio])
+
+## Returns True iff the process with the given id is running on this host
+def _alive(pid):
+    try:
+        os.kill(pid,0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+### Scheduler of the cells of a sweep
+#  Several schedulers (e.g. in parallel worker processes) may work on
+#  the same file: cells are claimed in transactions.
+## Attributes
+#   .spec: the sweep spec
+#   .max_attempts: max. nr. of attempts of a failed cell
+#   .store: results store (resstore) of the file
+#   ._con: connection to the file for the table of cells
+## Methods
+#   .claim: marks the next cell to run as running and returns it
+#   .finish, .fail: save the result of the cell / mark it as failed
+#   .run: runs cells until no cell is left
+#   .summary: returns nrs. of cells in each state
+class scheduler:
+    def __init__(self,fname,spec,max_attempts=3,timeout=60.):
+        self.spec=spec
+        self.max_attempts=max_attempts
+        self.store=rs.resstore(fname,timeout)
+        self._con=sqlite3.connect(fname,timeout=timeout,isolation_level=None)
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS cells ("+
+            "perturb REAL, coptimism REAL, uf INTEGER, method TEXT, "+
+            "run INTEGER, seed INTEGER, priority INTEGER, state TEXT, "+
+            "attempts INTEGER, pid INTEGER, message TEXT, "+
+            "PRIMARY KEY ("+", ".join(rs.keys)+"))")
+        self._con.execute("BEGIN IMMEDIATE")
+        for i,c in enumerate(cells(spec)):
+            state="done" if self.store.done(**c) else "pending"
+            self._con.execute(
+                "INSERT OR IGNORE INTO cells VALUES (?,?,?,?,?,?,?,?,0,NULL,NULL)",
+                [c[s] for s in rs.keys]+[i,state])
+            # priorities follow the current spec
+            self._con.execute(
+                "UPDATE cells SET priority=? WHERE "+
+                " AND ".join(s+"=?" for s in rs.keys),
+                [i]+[c[s] for s in rs.keys])
+        # cells left running by stopped processes are pending again, or done
+        # if the process stopped after saving the result (see finish)
+        for row in self._con.execute(
+                "SELECT "+", ".join(rs.keys)+", pid FROM cells "+
+                "WHERE state='running'").fetchall():
+            if row[-1] is None or not(_alive(row[-1])):
+                c=dict(zip(rs.keys,row))
+                w,par=self._where(c)
+                if self.store.done(**c):
+                    self._con.execute(
+                        "UPDATE cells SET state='done', message=NULL"+w,par)
+                else:
+                    self._con.execute(
+                        "UPDATE cells SET state='pending', attempts=attempts-1"+
+                        w,par)
+        self._con.execute("COMMIT")
+
+## Returns the WHERE clause of the cell and its parameters
+    @staticmethod
+    def _where(c):
+        return " WHERE "+" AND ".join(s+"=?" for s in rs.keys), \
+               [c[s] for s in rs.keys]
+
+## Marks the next cell as running and returns it (None if no cell is left):
+#  pending cells in the priority order, then failed cells with attempts left
+    def claim(self):
+        self._con.execute("BEGIN IMMEDIATE")
+        row=self._con.execute(
+            "SELECT "+", ".join(rs.keys)+" FROM cells WHERE state='pending' "+
+            "OR (state='failed' AND attempts<?) "+
+            "ORDER BY state='failed', priority LIMIT 1",
+            [self.max_attempts]).fetchone()
+        if row is None:
+            self._con.execute("COMMIT")
+            return None
+        c=dict(zip(rs.keys,row))
+        w,par=self._where(c)
+        self._con.execute(
+            "UPDATE cells SET state='running', attempts=attempts+1, pid=?"+w,
+            [os.getpid()]+par)
+        self._con.execute("COMMIT")
+        return c
+
+## Saves indicators (dictionary) of the cell and marks it as done
+    def finish(self,c,res):
+        self.store.add(**c,**res)
+        w,par=self._where(c)
+        self._con.execute("UPDATE cells SET state='done', message=NULL"+w,par)
+
+## Marks the cell as failed with the message
+    def fail(self,c,message):
+        w,par=self._where(c)
+        self._con.execute("UPDATE cells SET state='failed', message=?"+w,
+                          [message]+par)
+
+## Runs cells by f(**cell) -> dictionary of indicators until no cell is left;
+#  exceptions mark the cell as failed, interrupting leaves it pending
+    def run(self,f):
+        while True:
+            c=self.claim()
+            if c is None:
+                return
+            print("\n*****\nCell: ",c)
+            try:
+                res=f(**c)
+            except KeyboardInterrupt:
+                w,par=self._where(c)
+                self._con.execute(
+                    "UPDATE cells SET state='pending', attempts=attempts-1"+w,
+                    par)
+                raise
+            except Exception:
+                print(traceback.format_exc())
+                self.fail(c,traceback.format_exc())
+                continue
+            self.finish(c,res)
+
+## Returns {state: nr. of cells}
+    def summary(self):
+        d={s:0 for s in states}
+        d.update(self._con.execute(
+            "SELECT state, COUNT(*) FROM cells GROUP BY state").fetchall())
+        return d
+
+    def close(self):
+        self._con.close()
+        self.store.close()
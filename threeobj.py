@@ -1,4 +1,5 @@
-from scipy.optimize import shgo
+from scipy.optimize import shgo, minimize
+from scipy.stats import qmc
 import numpy as np
 import copy
 import sys
@@ -27,7 +28,10 @@ def f3(x):
     return phi([x[0]-1,x[1]])
 
 fvect=[f1,f2,f3]
+nfev_f=0 # nr. of evaluations of the vector objective function
 def f(x): # the vector objective function
+    global nfev_f
+    nfev_f+=1
     return np.array([f1(x),f2(x),f3(x)])
 
 ## ideal, nadir
@@ -52,23 +56,179 @@ def rhosum_f(xt,*args):
            xt[-1]#+ # t
            #args[1] * sum( args[2]*(f(xt[:-1])-args[0]) ) # augm. term
            )
-## l.h.s. fcuntions for ASF constraints: t >= w_i(f_i(x)-ref.point_i), i=1..n
-t_constr=[ # *args = (ref.point_i,weight_i)
-        lambda xt,*args: 
-            -args[1]*fvect[0](xt[:-1])+xt[-1]+args[1]*args[0] - 10**-8*sum(f(xt[:-1])*args[1]),
-        lambda xt,*args: 
-            -args[1]*fvect[1](xt[:-1])+xt[-1]+args[1]*args[0] - 10**-8*sum(f(xt[:-1])),
-        lambda xt,*args: 
-            -args[1]*fvect[2](xt[:-1])+xt[-1]+args[1]*args[0] - 10**-8*sum(f(xt[:-1])),
-        lambda xt: -fvect[0](xt[:-1]) + 1 # keep artificial upper bound    
-        ]
+## l.h.s. of problem-specific constraints g(y)>=0 for objective vector y
+def prob_constr(y):
+    return [-y[0] + 1] # keep artificial upper bound
+
+## l.h.s. of all inequality constraints g(xt)>=0 of the scalarized problem
+#  as one vector; objectives are evaluated once per point
+#  *args = ( ref.point(array), weights(array), subset of objectives(array),
+#            indices of upper bounds(array), upper bounds(array) )
+#   - ASF constraints: t >= w_i(f_i(x)-ref.point_i) + augmentation, i in subset
+#     (the augmentation term of the first objective is multiplied by its 
+#      weight as in the original three-objective formulation)
+#   - problem-specific constraints
+#   - upper bounds: f_i(x) <= upper bound_i
+def g_constr(xt,refp,w,subset,ubind,ubval):
+    y=f(xt[:-1])
+    return np.concatenate((
+        asf_constr(y,xt[-1],refp,w,subset),
+        prob_constr(y),
+        ubval-y[ubind]
+        ))
+
+## l.h.s. of ASF constraints for objective vector y and t
+def asf_constr(y,t,refp,w,subset):
+    return -w[subset]*y[subset] + t + w[subset]*refp[subset] - \
+        10**-8*np.array([sum(y*w[i]) if i==0 else sum(y) for i in subset])
+
+### SHARED SAMPLING TABLE
+## Sampling designs of the variable space and objective values on them,
+#  shared by all solves with sampl_m="table":
+#  {(objective functions, nvar, variable bounds, npoints, itern):
+#   [X (points as rows), Y (objectives)]}
+#  (the problem is in the key, so that redefining it does not reuse the table)
+_tables={}
+
+## vectorized objective function: rows of X -> rows of objective values
+def f_table(X):
+    global nfev_f
+    nfev_f+=len(X)
+    return np.array([fi(X.T) for fi in fvect]).T
+
+## Returns [X,Y] of the Sobol design of at least npoints*itern points in
+#  variable bounds, evaluated once per (problem, bounds, npoints, itern)
+def get_table(npoints,itern):
+    key=(tuple(fvect),nvar,tuple(bnd[:nvar]),npoints,itern)
+    if key not in _tables:
+        m=int(np.ceil(np.log2(npoints*itern)))
+        X=qmc.scale(qmc.Sobol(nvar,scramble=False).random_base2(m),
+                    [b[0] for b in bnd[:nvar]],[b[1] for b in bnd[:nvar]])
+        _tables[key]=[X,f_table(X)]
+    return _tables[key]
+
+## Given objective vectors Y (rows), Returns the least t satisfying ASF
+#  constraints for each of them and the mask of vectors satisfying the bounds
+#  of t, the problem-specific constraint and the upper bounds
+def _least_t(Y,refp,w,subset,ubind,ubval):
+    T=(w[subset]*(Y[:,subset]-refp[subset])+
+       10**-8*np.outer(Y.sum(axis=1),np.where(subset==0,w[subset],1))
+       ).max(axis=1)
+    feas=(T>=bnd[-1][0])&(T<=bnd[-1][1])
+    for y0 in [1-Y[:,0]]+[ubval[j]-Y[:,i] for j,i in enumerate(ubind)]:
+        feas&=y0>=0 # problem-specific constraint and upper bounds
+    return T,feas
+
+## Local SLSQP solves of min fun(x,*args) within bounds and constraints
+#  started from the rows of X0 (for the scalarized problem, decision
+#  vectors with t values);
+#  Returns the best result as shgo or None if no local solve succeeded
+def _solve_local(fun,X0,bounds,constr_list,args=()):
+    best=None
+    nfev=0
+    for x in X0:
+        res=minimize(fun,x,args=args,method="SLSQP",
+                     bounds=bounds,constraints=constr_list)
+        nfev+=res["nfev"]
+        if res["success"] and (best is None or res["fun"]<best["fun"]):
+            best=res
+    if best is None:
+        return None
+    return {"x": best["x"], "fun": best["fun"], "message": best["message"],
+            "nfev": nfev, "nlfev": nfev}
+
+## Returns the array of decision vectors of warm starts x0 (rows, possibly
+#  with t values) clipped to the variable bounds
+def _clipx(x0):
+    return np.clip(np.array(x0,dtype=float).reshape(len(x0),-1)[:,:nvar],
+                   [b[0] for b in bnd[:nvar]],[b[1] for b in bnd[:nvar]])
+
+## Solving the scalarized problem starting from the shared table:
+#  ASF values (the least feasible t) of all sample points are calculated 
+#  at once, and local SLSQP solves are started from ncand best feasible points;
+#  warm-start decision vectors x0 (if given) are candidates as sample points;
+#  Returns the result as shgo or None if no local solve succeeded
+def _solve_table(refp,w,subset,ubind,ubval,constr_list,itern,npoints,ncand=3,
+                 x0=None):
+    X,Y=get_table(npoints,itern)
+    if x0 is not None and len(x0)>0:
+        X0=_clipx(x0)
+        X=np.vstack([X,X0])
+        Y=np.vstack([Y,f_table(X0)])
+    # least t satisfying ASF constraints for each sample point
+    T,feas=_least_t(Y,refp,w,subset,ubind,ubval)
+    jj=np.flatnonzero(feas)[np.argsort(T[feas])][:ncand]
+    return _solve_local(rhosum_f,np.column_stack((X[jj],T[jj])),bnd,
+                        constr_list,(refp,10**-6,w))
+
+## Solving the scalarized problem by local solves started from warm-start
+#  decision vectors x0 (e.g. solutions for nearby reference points):
+#  ncand of them with the least t are used, feasible ones first (satisfying
+#  the bounds of t, the problem constraint and upper bounds), t is clipped
+#  to its bounds;
+#  Returns the result as shgo or None if no local solve succeeded
+def _solve_warm(refp,w,subset,ubind,ubval,constr_list,x0,ncand=3):
+    X=_clipx(x0)
+    T,feas=_least_t(f_table(X),refp,w,subset,ubind,ubval)
+    jj=np.lexsort((T,~feas))[:ncand]
+    return _solve_local(rhosum_f,np.column_stack((X[jj],np.clip(T[jj],*bnd[-1]))),
+                        bnd,constr_list,(refp,10**-6,w))
 
 ### PROBLEM SOLVING
+## Statistics of multi-fidelity solves (see solve_ref with refine):
+#  nr. of screening solves and refinements, and objective evaluations of them
+mf_stats={"nscreen": 0, "nrefine": 0, "nfev_screen": 0, "nfev_refine": 0}
+
+## Returns the estimate of objective evaluations saved by multi-fidelity
+#  solves: skipped refinements at the mean cost of refinements, less the
+#  cost of all screening solves (None before the first refinement);
+#  stats = statistics as mf_stats (e.g. differences over a run), 
+#          by default mf_stats
+def mf_saved(stats=None):
+    if stats is None:
+        stats=mf_stats
+    if stats["nrefine"]==0:
+        return None
+    return (stats["nscreen"]-stats["nrefine"])* \
+        stats["nfev_refine"]/stats["nrefine"]-stats["nfev_screen"]
+
 # solving the scalarized problem
+#  sampl_m = sampling method of shgo or "table" for local solves started from
+#            the shared sampling table (with fallback to shgo)
+#  x0 = list of warm-start decision vectors: with sampl_m="table", they are
+#       candidates of local solves together with the table points; otherwise
+#       local solves are started from them first, and their solution is
+#       used if its ASF constraints are tight and its ASF value is not worse
+#       than of a cheap global screen (one local solve from the shared table
+#       of screen_itern*screen_npoints points); otherwise the problem is
+#       solved by sampling, and the best of the warm, screening and sampling
+#       solutions is used
+#  refine = function (objective vector) -> True if the solution should be
+#       refined (multi-fidelity mode): the problem is first solved by one
+#       local solve from the shared table of screen_itern*screen_npoints
+#       points, and solved with sampl_m, itern and npoints only if
+#       the screening solve failed or refine returns True
+#  ncand = nr. of local solves from the shared table (sampl_m="table")
 def solve_ref(refpoint,w,sampl_m='simplicial',itern=5,npoints=100,
               subset=None, # subset of objectives to minimize
-              upbounds=None # vector of [(upper bound or None) for each objective] 
+              upbounds=None, # vector of [(upper bound or None) for each objective] 
+              x0=None,
+              refine=None,screen_itern=1,screen_npoints=32,ncand=3
               ):
+    if refine is not None:
+        nfev_f0=nfev_f
+        sol=solve_ref(refpoint,w,"table",screen_itern,screen_npoints,
+                      subset,upbounds,x0,ncand=1)
+        mf_stats["nscreen"]+=1
+        mf_stats["nfev_screen"]+=nfev_f-nfev_f0
+        if sol["y"] is not None and not(refine(sol["y"])):
+            return sol
+        nfev_f0=nfev_f
+        sol=solve_ref(refpoint,w,sampl_m,itern,npoints,subset,upbounds,x0)
+        mf_stats["nrefine"]+=1
+        mf_stats["nfev_refine"]+=nfev_f-nfev_f0
+        return sol
+    nfev_f0=nfev_f
     for ishift in [3,5,10]:
         # shifting the ref. point to exceed nadir+(nadir-ideal)
         tadd=max(0,max(w0*(ishift*nadir-(ishift-1)*ideal-refpoint)))
@@ -76,43 +236,53 @@ def solve_ref(refpoint,w,sampl_m='simplicial',itern=5,npoints=100,
         # list of objectives to minimize
         if subset is None:
             subset=range(len(refpoint))
-        #creating constraints
-        constr_list=[ 
-                     { # ASF linearization constraint
-                      "type": "ineq",
-                      "fun": t_constr[i],
-                      "args": (refp[i],w[i])
-                      } for i in subset
-                    ]+[{ # problem-specifi constraint
-                        "type": "ineq",
-                        "fun": t_constr[3]
-                            }]
-        if upbounds is not None:
-            for i,b in enumerate(upbounds):
-                if b is not None:
-                    constr_list.append({
+        #creating constraints: all of them as one vector function
+        subset_a=np.array(subset,dtype=int)
+        ubind=np.array([] if upbounds is None else
+                       [i for i,b in enumerate(upbounds) if b is not None],
+                       dtype=int)
+        ubval=np.array([upbounds[i] for i in ubind],dtype=float)
+        constr_list=[{ 
                       "type": "ineq",
-                      "fun": lambda xt, *args: # function nr, constraint
-                             -fvect[args[0]](xt[:-1]) + args[1],
-                      "args":(i,b)
-                      })
+                      "fun": g_constr,
+                      "args": (refp,w,subset_a,ubind,ubval)
+                      }]
         # calling the solver
-        sol = shgo(
+        sol=None
+        cands=[] # warm and screening solutions for comparing with sampling
+        if x0 is not None and len(x0)>0 and sampl_m!="table":
+            solw=_solve_warm(refp,w,subset_a,ubind,ubval,constr_list,x0)
+            if solw is not None and \
+                    min(asf_constr(f(solw["x"][:-1]),solw["x"][-1],
+                                   refp,w,subset_a))<=10**-6:
+                # a local optimum: compared with the cheap global screen
+                scr=_solve_table(refp,w,subset_a,ubind,ubval,constr_list,
+                                 screen_itern,screen_npoints,1)
+                if scr is None or solw["fun"]<=scr["fun"]+10**-6:
+                    sol=solw
+                else:
+                    cands=[solw,scr]
+        if sol is None and sampl_m=="table":
+            sol=_solve_table(refp,w,subset_a,ubind,ubval,constr_list,
+                             itern,npoints,ncand,x0)
+        if sol is None:
+            sol = shgo(
                 rhosum_f, #obj. function
                 bounds=bnd, # variable bounds
                 args=(np.array(refp),10**-6,w), # parameters for obj. func.
                 constraints=constr_list,
-                sampling_method=sampl_m,
+                sampling_method=sampl_m if sampl_m!="table" else "simplicial",
                 iters=itern,
                 n=npoints,
                 options={"minimize_every_iter":True,"local_iter":False}
                )
+        for c in cands:
+            if sol["x"] is None or c["fun"]<sol["fun"]:
+                sol=c
         # are ASF constraints tight?
         if sol["x"] is not None:
-            constr=[
-                    t_constr[i](sol["x"],refp[i],w[i])
-                    for i in subset
-                    ]
+            constr=list(asf_constr(f(sol["x"][:-1]),sol["x"][-1],
+                                   refp,w,subset_a))
             if min(constr)>10**-6:
                 if ishift==10:
                     print("Wrong constraints on shift ",ishift, " for \nRefp: ",
@@ -132,15 +302,36 @@ def solve_ref(refpoint,w,sampl_m='simplicial',itern=5,npoints=100,
             "fun": sol["fun"],
             "nfev": sol["nfev"],
             "nlfev":sol["nlfev"],
+            "nfev_f":nfev_f-nfev_f0, # nr. of objective vector evaluations
             "constr":constr,
             "y":f(sol["x"][:-1]) if sol["x"] is not None else None
             }
 
+## Returns the list of warm starts x0 with decision vectors of solved
+#  results of solve_ref (None if x0 is None, i.e. without warm starts)
+def _warm_list(x0,res):
+    if x0 is None:
+        return None
+    return list(x0)+[r["x"][:nvar] for r in res if r["x"] is not None]
+
+## Returns the refine function of solve_ref for a subproblem given 
+#  the function refine(objective vector, objective vectors of results p of
+#  sibling subproblems) of solve_rpm / solve_nimb (None if refine is None)
+def _refine_sib(refine,p):
+    if refine is None:
+        return None
+    return lambda y: refine(y,[r["y"] for r in p if r["y"] is not None])
+
 ## Deriving P.O. solutions for the reference point method
+#  (x0 = warm starts as in solve_ref, used with the solutions found so far;
+#   refine = None or function (objective vector, list of objective vectors
+#            of sibling subproblems) -> True if the solution is refined,
+#            see solve_ref)
 def solve_rpm(refpoint,w,
-              sampl_m='simplicial',itern=5,npoints=100):
+              sampl_m='simplicial',itern=5,npoints=100,x0=None,refine=None):
     p=[solve_ref(refpoint,w,
-                 sampl_m=sampl_m,itern=itern,npoints=npoints)]
+                 sampl_m=sampl_m,itern=itern,npoints=npoints,x0=x0,
+                 refine=_refine_sib(refine,[]))]
 
     # Modified ASF solutions
     normdif=np.linalg.norm(refpoint-p[0]["y"]) # perturbation value
@@ -148,14 +339,16 @@ def solve_rpm(refpoint,w,
         pref1=copy.deepcopy(refpoint)
         pref1[i]+=normdif
         p.append(solve_ref(pref1,w,
-                 sampl_m=sampl_m,itern=itern,npoints=npoints))
+                 sampl_m=sampl_m,itern=itern,npoints=npoints,
+                 x0=_warm_list(x0,p),refine=_refine_sib(refine,p)))
     return p
 
 ## Deriving P.P. solutions for the Nimbus method
 #   y - current P.opt. solution  
 #   tol - tolerance of assignment to classes "<", "=" and ">"    
+#   x0, refine - warm starts and multi-fidelity mode as in solve_rpm
 def solve_nimb(refpoint,w,y,tol=0.01,
-               sampl_m='simplicial',itern=5,npoints=100):
+               sampl_m='simplicial',itern=5,npoints=100,x0=None,refine=None):
     ## assigning objectives to classes from "<" to ">"
     s_l = []
     s_leq = []
@@ -195,48 +388,86 @@ def solve_nimb(refpoint,w,y,tol=0.01,
         uporig[i]=refpoint[i]
     p.append(solve_ref(#!! itern changed to 6 here
                 ref1,w0,subset=s_l+s_leq,upbounds=uporig,
-                sampl_m=sampl_m,itern=6,npoints=npoints)
+                sampl_m=sampl_m,itern=6,npoints=npoints,
+                x0=_warm_list(x0,p),refine=_refine_sib(refine,p))
             )
     # from STOM (3.2)
     print("3.2", end=" ")    
     wstom=1/(np.array(ref1)-utopia)
     p.append(solve_ref(
                 utopia, wstom,
-                sampl_m=sampl_m,itern=itern,npoints=npoints)
+                sampl_m=sampl_m,itern=itern,npoints=npoints,
+                x0=_warm_list(x0,p),refine=_refine_sib(refine,p))
             )
     # simple ASF (3.3)
     print("3.3", end=" ")
     p.append(solve_ref(
                 ref1, w0,
-                sampl_m=sampl_m,itern=itern,npoints=npoints)
+                sampl_m=sampl_m,itern=itern,npoints=npoints,
+                x0=_warm_list(x0,p),refine=_refine_sib(refine,p))
             )
     # from GUESS (3.4)
     print("3.4")
     p.append(solve_ref(
                 nadir, 1/(nadir-np.array(ref1)),
                 subset = s_l + s_leq + s_eq + s_geq,
-                sampl_m=sampl_m,itern=itern,npoints=npoints)
+                sampl_m=sampl_m,itern=itern,npoints=npoints,
+                x0=_warm_list(x0,p),refine=_refine_sib(refine,p))
             )
     return p
 
-def solve_uf(uf,sampl_m='simplicial',itern=5,npoints=100):
-    sol = shgo(
-        lambda x: uf(f(x)), #obj. function
-        bounds=bnd[:nvar], # variable bounds
-        constraints=[{ # keep artificial upper bound
-                    "type": "ineq",
-                    "fun": lambda xt: -fvect[0](xt) + 1 
-                            }],
-        sampling_method=sampl_m,
-        iters=itern,
-        n=npoints,
-        options={"minimize_every_iter":True,"local_iter":False}
-       )
+# minimizing uf(objective vector) over the feasible set
+#  sampl_m = sampling method of shgo or "table" for local solves started from
+#            ncand best feasible points of the shared table (with fallback
+#            to shgo)
+#  Returns [x, objective vector, uf value, result as shgo]
+def solve_uf(uf,sampl_m='simplicial',itern=5,npoints=100,ncand=3):
+    constr_list=[{ # keep artificial upper bound
+                  "type": "ineq",
+                  "fun": lambda xt: -fvect[0](xt) + 1 
+                  }]
+    sol=None
+    if sampl_m=="table":
+        X,Y=get_table(npoints,itern)
+        U=np.array([uf(y) for y in Y])
+        feas=np.array(prob_constr(Y.T)).min(axis=0)>=0
+        jj=np.flatnonzero(feas)[np.argsort(U[feas])][:ncand]
+        sol=_solve_local(lambda x: uf(f(x)),X[jj],bnd[:nvar],constr_list)
+    if sol is None:
+        sol = shgo(
+            lambda x: uf(f(x)), #obj. function
+            bounds=bnd[:nvar], # variable bounds
+            constraints=constr_list,
+            sampling_method=sampl_m if sampl_m!="table" else "simplicial",
+            iters=itern,
+            n=npoints,
+            options={"minimize_every_iter":True,"local_iter":False}
+           )
     return[ sol["x"],f(sol["x"]), uf(f(sol["x"])),sol]
     
     
 
+## Check of warm starts: Returns ASF values of solutions of solve_ref 
+#  without and with warm starts x0 (other arguments as solve_ref)
+def check_warm(refpoint,w,x0,**kwargs):
+    res=[]
+    for x in [None,x0]:
+        sol=solve_ref(refpoint,w,x0=x,**kwargs)
+        subset=kwargs.get("subset") or range(len(refpoint))
+        res.append(None if sol["y"] is None else 
+                   max((w*(sol["y"]-refpoint))[list(subset)]))
+    return res
+
 if __name__=="__main__":
+    # warm start from a local optimum at a multimodal reference point
+    asf0,asf1=check_warm(
+        np.array([-0.3400825806223018,0.3847679930168133,0.28224750328282266]),
+        1/(np.array([-0.3400825806223018,0.3847679930168133,0.28224750328282266])
+           -utopia),
+        [np.array([0.6283249873750498,0.8063689554796819])],
+        sampl_m="table",subset=[1],
+        upbounds=[1.2608586058992475,None,-0.5704263995346737])
+    print("ASF without / with warm start: ",asf0,asf1)
     rp=np.array([ 7.,12.68296,12.87776])
     for i in [1,2,3]:
         sol=solve_ref(
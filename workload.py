@@ -0,0 +1,216 @@
+### Synthetic many-objective workloads with analytic Pareto fronts
+#  for load tests of ADM without solver costs (unlike threeobj).
+#  All fronts lie in the unit box (ideal = 0, nadir = 1) of k objectives:
+#    "linear":       sum(y)=1, y>=0
+#    "spherical":    ||y||=1, y>=0 (concave front)
+#    "disconnected": pieces {y>=c_j, sum(y)=1} of the linear front around
+#                    the points c_j of the simplex lattice, separated by gaps
+#    "degenerate":   the segment y=(u,1-u,...,1-u), u in [0,1] (1-D front)
+#  The ASF  max_i w_i*(y_i-r_i)  is minimized over the objective space
+#  (the front with everything it dominates) in closed form, giving
+#  Pareto optimal projections of reference points without sampling.
+import itertools
+import time
+import numpy as np
+
+kinds=["linear","spherical","disconnected","degenerate"]
+
+## Returns the list of points of the simplex lattice with n divisions in k dims
+def simplex_lattice(k,n):
+    return np.array([c for c in itertools.product(range(n+1),repeat=k)
+                     if sum(c)==n],dtype=float)/n
+
+### Analytic Pareto front of a given kind in k dimensions
+## Attributes
+#   .kind, .k: kind of the front (see kinds) and nr. of objectives
+#   .ideal, .nadir, .utopia: corresponding points
+#   .w0: basic weights for Chebyshev (as threeobj.w0)
+#   .nproj: nr. of ASF projections made
+#   ._c, ._s, ._p: offsets of pieces {y>=c_j, ||y-c_j||_p>=s} of the
+#                  objective space of smooth fronts (one piece if connected)
+## Methods
+#   .project: closed-form ASF projection of a reference point on the front
+#   .get_sol_ref, .get_sol_rpm, .get_sol_nimb: method functions with
+#                  the signature of adm2.get_sol_nimb / adm2.get_sol_rpm
+#   .sample: random Pareto optimal vectors
+class front:
+    def __init__(self,kind,k,ngrid=2):
+        if kind not in kinds:
+            raise ValueError("Unknown front: "+str(kind))
+        self.kind=kind
+        self.k=k
+        self.ideal=np.zeros(k)
+        self.nadir=np.ones(k)
+        self.utopia=self.ideal-10**-5
+        self.w0=1/(self.nadir-self.ideal)
+        self.nproj=0
+        self._p=2 if kind=="spherical" else 1
+        if kind=="disconnected":
+            # pieces do not overlap if s < (1-s)/ngrid
+            self._s=1/(2*ngrid+2)
+            self._c=(1-self._s)*simplex_lattice(k,ngrid)
+        else:
+            self._s=1.
+            self._c=np.zeros((1,k))
+
+## Given reference point r and weights w, Returns the Pareto optimal vector
+#  minimizing the ASF
+    def project(self,r,w):
+        self.nproj+=1
+        r=np.asarray(r,dtype=float)
+        w=np.asarray(w,dtype=float)
+        if self.kind=="degenerate":
+            return self._project_segment(r,w)
+        # for each piece, ASF value t and the vector on the ray r+t/w,
+        # where t>=t0 is needed for y>=c
+        R=r-self._c
+        b=1/w
+        t0=np.max(-R*w,axis=1)
+        Z0=R+t0[:,None]*b
+        g0=np.linalg.norm(Z0,ord=self._p,axis=1)
+        if self._p==1:
+            t1=(self._s-R.sum(axis=1))/b.sum()
+        else:
+            # larger root of ||R+t*b||^2 = s^2
+            qa=b@b
+            qb=R@b
+            qc=(R*R).sum(axis=1)-self._s**2
+            t1=(-qb+np.sqrt(np.maximum(qb*qb-qa*qc,0)))/qa
+        qin=g0>=self._s
+        t=np.where(qin,t0,t1)
+        # at t0, the ray point is dominated and scaled down to the front
+        Z=np.where(qin[:,None],Z0*(self._s/np.maximum(g0,1e-300))[:,None],
+                   R+t[:,None]*b)
+        j=np.argmin(t)
+        return self._c[j]+Z[j]
+
+## ASF projection on the degenerate front: t(u) is the max. of the increasing
+#  line of objective 0 and decreasing lines of others, so the minimum is at
+#  an intersection of line 0 with another line or at an end of the segment
+    def _project_segment(self,r,w):
+        u=(w[1:]*(1-r[1:])+w[0]*r[0])/(w[0]+w[1:])
+        u=np.clip(np.concatenate([u,[0.,1.]]),0,1)
+        Y=np.column_stack([u]+[1-u for i in range(self.k-1)])
+        j=np.argmin(np.max(w*(Y-r),axis=1))
+        return Y[j]
+
+## Returns n random Pareto optimal vectors
+    def sample(self,n):
+        if self.kind=="degenerate":
+            u=np.random.rand(n)
+            return np.column_stack([u]+[1-u for i in range(self.k-1)])
+        z=np.abs(np.random.randn(n,self.k))
+        z=z/np.linalg.norm(z,ord=self._p,axis=1)[:,None]*self._s
+        return self._c[np.random.randint(len(self._c),size=n)]+z
+
+## Method functions: signatures as adm2.get_sol_nimb, other arguments of
+#  solvers (e.g. itern, sampl_m) are ignored
+    def get_sol_ref(self,pref,w,y,**kwargs):
+        return [self.project(pref,w)]
+
+## Reference point method (as threeobj.solve_rpm): the ASF projection and
+#  projections of the reference point shifted along each objective
+    def get_sol_rpm(self,pref,w,y,**kwargs):
+        p=[self.project(pref,w)]
+        normdif=np.linalg.norm(pref-p[0])
+        for i in range(self.k):
+            pref1=np.array(pref,dtype=float)
+            pref1[i]+=normdif
+            p.append(self.project(pref1,w))
+        return p
+
+## Nimbus (as threeobj.solve_nimb) with the STOM, ASF and GUESS subproblems;
+#  the subproblem with upper bounds and the subsets of objectives have no
+#  closed form here and are omitted (GUESS weights of objectives at nadir
+#  are bounded instead)
+    def get_sol_nimb(self,pref,w,y,tol=0.01,**kwargs):
+        if y is None:
+            return [self.project(pref,w)]
+        itol=(self.nadir-self.ideal)*tol
+        ref1=np.array(pref,dtype=float)
+        ref1[np.abs(self.ideal-ref1)<=itol]=self.ideal[np.abs(self.ideal-ref1)<=itol]
+        ref1[np.abs(self.nadir-ref1)<=itol]=self.nadir[np.abs(self.nadir-ref1)<=itol]
+        return [self.project(self.utopia,1/(ref1-self.utopia)),
+                self.project(ref1,self.w0),
+                self.project(self.nadir,1/np.maximum(self.nadir-ref1,itol))]
+
+## Returns [p50, p90, p99, max] of the array of latencies
+def _percentiles(a):
+    return np.percentile(a,[50,90,99,100]).tolist()
+
+## Load test of ADM iterations with closed-form methods:
+#  for each kind of front and nr. of objectives k, runs niter iterations of
+#  ADM.nextiter (q preference points per iteration) with the method
+#  ("ref", "rpm" or "nimb") and a random multiplicative CES utility, and
+#  Returns the list of rows (dictionaries) for each window of iterations:
+#     throughput (iterations per second), latency percentiles (seconds) of
+#     ADM steps and method calls, nr. of boxes and Pareto vectors,
+#     approximate bytes of the index and archive, peak traced allocations
+#  A run stops early on the hard limit of mem_limits (see ADM.mem_limits).
+def loadtest(kinds=kinds,ks=(3,5,7,10),niter=1000,window=100,method="rpm",
+             q=None,mem_limits=None,seed=0,verbose=True):
+    import adm2
+    rows=[]
+    for kind,k in itertools.product(kinds,ks):
+        np.random.seed(seed)
+        F=front(kind,k)
+        getsolf=getattr(F,"get_sol_"+method)
+        uw=1+np.random.rand(k)
+        A=adm2.ADM(F.ideal,F.nadir,
+                   lambda y,ideal,nadir:
+                       adm2.CES_mult(adm2.normalize(y,ideal,nadir),uw),
+                   0.5,uf_monotone=True,memstats=True,mem_limits=mem_limits)
+        p=[]
+        sel_boxes=None
+        t_adm=[]
+        t_meth=[]
+        tw=time.perf_counter()
+        for i in range(niter):
+            try:
+                t0=time.perf_counter()
+                result=A.nextiter(p,sel_boxes,q=q)
+                t1=time.perf_counter()
+            except MemoryError as e:
+                print("Stopped: ",e)
+                break
+            if q is None:
+                sel_boxes=[result["bestbox"]]
+                prefs=[result["pref"]]
+            else:
+                sel_boxes=result["bestbox"]
+                prefs=result["pref"]
+            ycurr=A.best_y()[0]
+            p=sum([getsolf(np.array(pref[0]),F.w0,ycurr) for pref in prefs],[])
+            p=np.unique(p,axis=0)
+            t_adm.append(t1-t0)
+            t_meth.append(time.perf_counter()-t1)
+            if (i+1)%window==0:
+                row={"kind": kind,"k": k,"iter": i+1,
+                     "throughput": window/(time.perf_counter()-tw),
+                     "adm_p50": 0.,"adm_p90": 0.,"adm_p99": 0.,"adm_max": 0.,
+                     "meth_p50": 0.,"meth_p90": 0.,"meth_p99": 0.,"meth_max": 0.,
+                     "nboxes": A._potreg.nbox,"npareto": A._npareto,
+                     "index_bytes": A.telemetry["index_bytes"][-1],
+                     "archive_bytes": A.telemetry["archive_bytes"][-1],
+                     "peak_traced": max([x for x in A.telemetry["peak_traced"]
+                                         [-window:] if x is not None],
+                                        default=None)}
+                for s,a in [("adm",t_adm),("meth",t_meth)]:
+                    for pc,x in zip(["p50","p90","p99","max"],
+                                    _percentiles(a[-window:])):
+                        row[s+"_"+pc]=x
+                rows.append(row)
+                if verbose:
+                    print(kind,k,i+1,": ",round(row["throughput"],1),"it/s, ADM p50/p99 ",
+                          row["adm_p50"],row["adm_p99"],", boxes ",row["nboxes"],
+                          ", bytes ",row["index_bytes"]+row["archive_bytes"])
+                tw=time.perf_counter()
+    return rows
+
+
+if __name__=="__main__":
+    import tracemalloc
+    import pandas as pd
+    tracemalloc.start()
+    rows=loadtest(ks=(3,5),niter=300,window=100,mem_limits=[None,2**30])
+    pd.DataFrame(rows).to_csv("loadtest.csv",index=False)